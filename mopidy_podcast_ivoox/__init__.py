@@ -30,11 +30,36 @@ class Extension(ext.Extension):
             lang=config.String(choices=ivooxapi.LANGUAGES),
             country=config.String(choices=ivooxapi.COUNTRIES),
             max_episodes=config.Integer(minimum=1, maximum=100),
-            max_programs=config.Integer(minimum=1, maximum=100)
+            max_programs=config.Integer(minimum=1, maximum=100),
+            workers=config.Integer(minimum=1, maximum=16),
+            cache_size=config.Integer(minimum=0),
+            pool_size=config.Integer(minimum=1),
+            connect_timeout=config.Integer(minimum=1),
+            read_timeout=config.Integer(minimum=1),
+            retries=config.Integer(minimum=0),
+            persistent_cache=config.Boolean(),
+            warm_cache=config.Boolean(),
+            warm_interval=config.Integer(minimum=0),
+            warm_depth=config.Integer(minimum=0, maximum=5),
+            warm_delay=config.Integer(minimum=0),
+            metrics=config.Boolean(),
+            metrics_interval=config.Integer(minimum=0),
+            feed_proxy=config.Boolean(),
+            prefetch_tracks=config.Integer(minimum=0, maximum=10),
+            latency_budget=config.Integer(minimum=0),
+            error_budget=config.Integer(minimum=0),
+            breaker_cooldown=config.Integer(minimum=1)
             )
         return schema
 
     def setup(self, registry):
         # TODO: Edit or remove entirely
         from .backend import IVooxBackend
+        from .frontend import IVooxFrontend
+        from .web import http_factory
         registry.add('backend', IVooxBackend)
+        registry.add('frontend', IVooxFrontend)
+        registry.add('http:app', {
+            'name': self.ext_name,
+            'factory': http_factory,
+        })
@@ -1,21 +1,39 @@
 from __future__ import unicode_literals
 
+import collections
+import itertools
 import logging
+import os
 import pykka
-import uritools
+import threading
+from functools import partial
 from mopidy import backend, models
 
+from . import Extension
+from .cache import ResponseCache
 from .client import IVooxClient
+from .feeds import FeedCache
+from .index import SearchIndex
+from .metrics import Metrics
+from .resolver import AudioResolver
+from .store import ScrapStore
+from .subscriptions import SubscriptionSync
+from .warmer import CacheWarmer
 import ivooxapi
 
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
 
 URI_SCHEME = 'podcast+ivoox'
 URI_EXPLORE = {'uri': URI_SCHEME + ':explore', 'ES': 'Explorar', 'EN': 'Explore'}
 URI_SUBS = {'uri': URI_SCHEME + ':subs', 'ES': 'Subscripciones', 'EN': 'Subscriptions'}
 URI_LIST = {'uri': URI_SCHEME + ':list', 'ES': 'Listas', 'EN': 'Lists'}
+URI_CHANNEL = {'uri': URI_SCHEME + ':channel',
+               'ES': 'Canales', 'EN': 'Channels'}
+URI_SEARCH = {'uri': URI_SCHEME + ':search', 'ES': 'Buscar', 'EN': 'Search'}
+URI_EPISODE = {'uri': URI_SCHEME + ':episode'}
+URI_PROGRAM = {'uri': URI_SCHEME + ':program'}
+URI_MORE = {'ES': 'M\xe1s\u2026', 'EN': 'More\u2026'}
 URI_LIST_ITEMS = [
     {'uri': URI_LIST['uri'] + ':favorites', 'ES': 'Favoritos', 'EN': 'Starred'},
     {'uri': URI_LIST['uri'] + ':pending', 'ES': 'Escuchar mas tarde', 'EN': 'Listen later'},
@@ -23,6 +41,55 @@ URI_LIST_ITEMS = [
     {'uri': URI_LIST['uri'] + ':history', 'ES': 'Historial', 'EN': 'History'}
 ]
 
+# Seconds the metadata of a browsed episode is kept for lookups
+EPISODE_TTL = 24 * 60 * 60
+
+# Seconds between polls of the subscriptions page
+SUBSCRIPTIONS_INTERVAL = 5 * 60
+
+# Local hits of each type that answer a search without asking iVoox
+LOCAL_SEARCH_HITS = 5
+
+# Types of items searched for the terms of each field of a query (episodes
+# are tracks, programs albums and channels artists), all for other fields
+SEARCH_TYPES = ('episodes', 'programs', 'channels')
+SEARCH_FIELDS = {
+    'track_name': ('episodes',),
+    'album': ('programs',),
+    'artist': ('channels',),
+    'albumartist': ('channels',),
+}
+
+
+def parse_uri(uri):
+    """Split a browse uri into its base uri, item code and page number.
+
+    'podcast+ivoox:explore:f43:page=2' -> ('podcast+ivoox:explore', 'f43', 2)
+    """
+    parts = uri.split(':')
+    page = 1
+    if len(parts) > 2 and parts[-1].startswith('page='):
+        page = parts.pop()[len('page='):]
+        page = max(int(page), 1) if page.isdigit() else 1
+    code = ':'.join(parts[2:]) or None
+    return ':'.join(parts[:2]), code, page
+
+
+def make_uri(base, code=None, page=1):
+    parts = [base]
+    if code:
+        parts.append(code)
+    if page > 1:
+        parts.append('page={:d}'.format(page))
+    return ':'.join(parts)
+
+
+def _merge(local, remote, limit):
+    # Local hits first, then the ones only iVoox knows about
+    urls = set(item.url for item in local)
+    return (local + [item for item in remote
+                     if item.url not in urls])[:limit]
+
 
 class IVooxBackend(pykka.ThreadingActor, backend.Backend):
 
@@ -31,6 +98,25 @@ class IVooxBackend(pykka.ThreadingActor, backend.Backend):
     def __init__(self, config, audio):
         super(IVooxBackend, self).__init__()
         self.library = IVooxLibraryProvider(config, self)
+        self.playback = IVooxPlaybackProvider(
+            audio, self, resolver=AudioResolver(
+                self.library.ivoox.session,
+                timeout=self.library.ivoox.timeout))
+        # Served by Mopidy-HTTP, see web.FeedHandler
+        self.feed_cache = self.library.feed_cache
+
+    def get_metrics(self):
+        return self.library.get_metrics()
+
+    def on_stop(self):
+        self.library.metrics.stop_logging()
+        if self.library.warmer:
+            self.library.warmer.stop()
+        self.playback.resolver.close()
+        self.library.ivoox.close()
+        self.library.feed_cache.close()
+        if self.library.ivoox.index is not None:
+            self.library.ivoox.index.close()
 
 
 class IVooxLibraryProvider(backend.LibraryProvider):
@@ -40,18 +126,101 @@ class IVooxLibraryProvider(backend.LibraryProvider):
 
         self.config = config['podcast-ivoox']
 
-        self.ivoox = IVooxClient(lang=self.config['lang'],
-                                 country=self.config['country'])
+        if self.config['persistent_cache']:
+            cache_dir = Extension.get_cache_dir(config)
+            store = ScrapStore(os.path.join(cache_dir, 'scraps.db'))
+            feeds_path = os.path.join(cache_dir, 'feeds.db')
+        else:
+            store = ScrapStore()
+            feeds_path = ':memory:'
 
-        self.ivoox.login(
-            user=self.config['username'],
-            password=self.config['password']
-        )
-        logger.info('Logging in to %s : %s',
-                    self.ivoox.baseurl,
-                    'OK' if self.ivoox.user_logged() else 'NOT LOGGED')
+        # Items browsed so far are searched locally first
+        index = SearchIndex(
+            os.path.join(Extension.get_data_dir(config), 'search.db'),
+            site=ivooxapi.get_baseurl(lang=self.config['lang'],
+                                      country=self.config['country']))
+
+        self.metrics = Metrics(enabled=self.config['metrics'])
+        self.metrics.start_logging(self.config['metrics_interval'])
 
-        self.refresh()
+        # Feeds and audios use main URL, not localized
+        self.feeds = ivooxapi.get_url_context()
+        self._podcast_uris = {}
+
+        self.ivoox = IVooxClient(lang=self.config['lang'],
+                                 country=self.config['country'],
+                                 workers=self.config['workers'],
+                                 cache_size=self.config['cache_size'],
+                                 pool_size=self.config['pool_size'],
+                                 timeout=(self.config['connect_timeout'],
+                                          self.config['read_timeout']),
+                                 retries=self.config['retries'],
+                                 store=store,
+                                 metrics=self.metrics,
+                                 index=index,
+                                 latency_budget=(
+                                     self.config['latency_budget'] / 1000.0),
+                                 error_budget=self.config['error_budget'],
+                                 breaker_cooldown=(
+                                     self.config['breaker_cooldown']))
+
+        # Program feeds are opened from their stored copy, asking iVoox
+        # for new episodes only, see also web.FeedHandler
+        self.feed_cache = FeedCache(self.ivoox.session, self.feeds,
+                                    path=feeds_path,
+                                    timeout=self.ivoox.timeout,
+                                    metrics=self.metrics)
+
+        # Only programs with new episodes are fetched again on each poll
+        self.subscriptions = SubscriptionSync(
+            self.ivoox, interval=SUBSCRIPTIONS_INTERVAL,
+            max_episodes=self.config['max_episodes'])
+
+        # Scraped episodes by guid, so tracks are looked up without
+        # downloading their program feeds
+        self._episodes = ResponseCache(
+            maxsize=self.config['cache_size'] * self.config['max_episodes'])
+        self._episode_record = ivooxapi.get_scrapper(
+            type='episodes', session=self.ivoox.session).record
+
+        self.login_done = threading.Event()
+
+        if self.config['warm_cache']:
+            self.warmer = CacheWarmer(self,
+                                      interval=self.config['warm_interval'],
+                                      depth=self.config['warm_depth'],
+                                      delay=self.config['warm_delay'],
+                                      skip_names=URI_MORE.values())
+            self.warmer.start()
+        else:
+            self.warmer = None
+
+        # Do not hold Mopidy startup while iVoox answers
+        self._startup = threading.Thread(target=self._login_and_warm_up,
+                                         name='IVooxLogin')
+        self._startup.daemon = True
+        self._startup.start()
+
+    def _login_and_warm_up(self):
+        try:
+            self.ivoox.login(
+                user=self.config['username'],
+                password=self.config['password']
+            )
+            logged = self.ivoox.user_logged()
+            logger.info('Logging in to %s : %s',
+                        self.ivoox.baseurl,
+                        'OK' if logged else 'NOT LOGGED')
+        finally:
+            self.login_done.set()
+
+        if self.warmer:
+            # Warmer starts walking from the root right now
+            return
+        try:
+            self.browse(self.root_directory.uri)
+        except Exception as ex:
+            logger.warning('Error loading iVoox root directory: %s', ex)
 
     @property
     def root_directory(self):
@@ -62,68 +231,342 @@ class IVooxLibraryProvider(backend.LibraryProvider):
 
     def browse(self, uri):
         logger.debug('Browsing URI: %s', uri)
+        if not self.metrics.enabled:
+            return self._browse(uri)
+        with self.metrics.timer('browse', parse_uri(uri)[0]):
+            return self._browse(uri)
 
+    def _browse(self, uri):
         # Browsing Root Directory
         if uri == self.root_directory.uri:
-            if self.ivoox.user_logged():
+            if self.login_done.is_set() and self.ivoox.user_logged():
                 # User is logged. Show custom menus and subscriptions
-                menu = self._translate_menu(URI_EXPLORE, URI_LIST)
-                subs = self._translate_programs(self.ivoox.get_subscriptions(),
-                                                info_field='new_audios')
-                return menu + subs
+                subs = self.subscriptions.programs()
+                with self.metrics.timer('translate', uri):
+                    return self._translate_menu(URI_EXPLORE, URI_SUBS,
+                                                URI_LIST) \
+                        + self._translate_programs(subs,
+                                                   info_field='new_audios')
             else:
                 # User not logged. Root URI shows explore categories
                 uri = URI_EXPLORE['uri']
 
         subgenres, episodes, programs = ([], [], [])
-
-        if uri.startswith(URI_LIST['uri']):
-            try:
-                _, _, code = uri.split(':', 3)
-            except ValueError:
+        more_episodes = more_programs = False
+        base, code, page = parse_uri(uri)
+
+        if base == URI_PROGRAM['uri'] and code:
+            episodes = self._feed_episodes(code)
+            self._index_episodes(episodes)
+            with self.metrics.timer('translate', base):
+                # Every episode of the program, as Mopidy-Podcast does
+                return [models.Ref.track(name=item.name,
+                                         uri=self._make_episode_uri(item))
+                        for item in episodes]
+
+        elif base == URI_SUBS['uri']:
+            if not self.ivoox.user_logged():
+                return []
+            if not code:
+                return self._translate_subscriptions(page)
+            episodes = self.subscriptions.episodes(code)
+            with self.metrics.timer('translate', base):
+                return self._translate_episodes(episodes)
+
+        elif base == URI_LIST['uri']:
+            if not code:
                 # Lists menu
                 menu = self._translate_menu(*URI_LIST_ITEMS)
                 lists = self._translate_lists(self.ivoox.get_user_lists())
                 return menu + lists
 
-            episodes = self.ivoox.explore_list(code)
-
-        elif uri.startswith(URI_EXPLORE['uri']):
-            try:
-                _, _, genre = uri.split(':', 3)
-            except ValueError:
-                genre = None
-
-            subgenres = self.ivoox.get_categories(parent=genre) \
-                if not genre or not genre.startswith('f4') else []
-            episodes = self.ivoox.explore(category=genre, type='episodes')
-            programs = self.ivoox.explore(category=genre, type='programs')
+            episodes, more_episodes, next_episodes = self._paginate(
+                partial(self.ivoox.explore_list, code),
+                page, self.config['max_episodes'])
+            self._prefetch(next_episodes)
+
+        elif base == URI_EXPLORE['uri']:
+            get_subgenres = partial(self.ivoox.get_categories, parent=code) \
+                if page == 1 and not (code and code.startswith('f4')) \
+                else list
+            subgenres, (episodes, more_episodes, next_episodes), \
+                (programs, more_programs, next_programs) \
+                = self.ivoox.parallel(
+                    get_subgenres,
+                    partial(self._paginate,
+                            partial(self.ivoox.explore, category=code,
+                                    type='episodes'),
+                            page, self.config['max_episodes']),
+                    partial(self._paginate,
+                            partial(self.ivoox.explore, category=code,
+                                    type='programs'),
+                            page, self.config['max_programs']))
+            self._prefetch(next_episodes, next_programs)
+
+        elif base == URI_CHANNEL['uri'] and code:
+            programs, more_programs, next_programs = self._paginate(
+                partial(self.ivoox.explore_channel, code),
+                page, self.config['max_programs'])
+            self._prefetch(next_programs)
 
         else:
             logger.error('Invalid browse URI: %s', uri)
             return []
 
-        return self._translate_categories(subgenres) \
-            + self._translate_programs(programs) \
-            + self._translate_episodes(episodes)
+        with self.metrics.timer('translate', base):
+            refs = self._translate_categories(subgenres) \
+                + self._translate_programs(programs) \
+                + self._translate_episodes(episodes)
+
+        # Next page is loaded only when browsed
+        if more_programs or more_episodes:
+            refs.append(models.Ref.directory(
+                name=URI_MORE[self.config['lang']],
+                uri=make_uri(base, code, page + 1)))
+        return refs
+
+    def get_metrics(self):
+        metrics = self.ivoox.stats()
+        metrics['enabled'] = self.metrics.enabled
+        metrics['warmer'] = self.warmer.state if self.warmer else None
+        return metrics
 
     def refresh(self, uri=None):
-        self.ivoox.clear_cache()
+        if not uri:
+            self.ivoox.clear_cache()
+            return
 
-    def lookup(self, uris):
-        return []
+        logger.debug('Refreshing URI: %s', uri)
+
+        if uri == self.root_directory.uri:
+            self.subscriptions.refresh()
+            uri = URI_EXPLORE['uri']
+
+        base, code, _ = parse_uri(uri)
+
+        if base == URI_SUBS['uri']:
+            self.subscriptions.refresh(code)
+
+        elif base == URI_PROGRAM['uri'] and code:
+            self.feed_cache.expire(ivooxapi.parse_feed_xml(code))
+
+        elif base == URI_LIST['uri']:
+            if code:
+                self.ivoox.invalidate('explore_list', code=code)
+            else:
+                self.ivoox.invalidate('get_user_lists')
+
+        elif base == URI_EXPLORE['uri']:
+            self.ivoox.invalidate('get_categories', parent=code)
+            self.ivoox.invalidate('explore', category=code)
+
+        elif base == URI_CHANNEL['uri'] and code:
+            self.ivoox.invalidate('explore_channel', code=code)
+
+    def lookup(self, uri):
+        # Mopidy core looks up one uri at a time, but a list is also taken
+        uris = list(uri) if isinstance(uri, (list, tuple)) else [uri]
+        results = self.lookup_many(uris)
+        return [track for each in uris for track in results[each]]
+
+    def lookup_many(self, uris):
+        """Return a dict with the list of tracks of each uri.
+
+        Episodes are served from the metadata index. The programs of those
+        missing from it are scraped at once, each one a single time, and
+        the episodes not listed on their first page are looked up in their
+        stored feeds.
+        """
+        results, missing = {}, {}
+        for uri in uris:
+            base, code, _ = parse_uri(uri)
+            if base != URI_EPISODE['uri']:
+                # Directories are looked up as the episodes they list
+                episodes = [ref.uri for ref in self.browse(uri)
+                            if ref.type == models.Ref.TRACK]
+                tracks = self.lookup_many(episodes)
+                results[uri] = [track for episode in episodes
+                                for track in tracks[episode]]
+                continue
+            program, _, guid = code.partition(':') if code else ('', '', '')
+            item = self._episodes.get(guid)
+            if item:
+                results[uri] = [self._make_track(item)]
+            elif program:
+                missing.setdefault(program, []).append((uri, guid))
+            else:
+                results[uri] = []
+
+        if missing:
+            logger.debug('Looking up episodes of programs: %s',
+                         ', '.join(missing))
+            self._index_episodes(itertools.chain(*self.ivoox.parallel(*[
+                partial(self.ivoox.get_program_episodes, program_code)
+                for program_code in missing])))
+
+            older = {program_code: set(guid for _, guid in pending
+                                       if not self._episodes.get(guid))
+                     for program_code, pending in missing.iteritems()}
+            self._index_episodes(itertools.chain(*self.ivoox.parallel(*[
+                partial(self._feed_episodes, program_code)
+                for program_code, guids in older.iteritems() if guids])))
+
+        for pending in missing.itervalues():
+            for uri, guid in pending:
+                item = self._episodes.get(guid)
+                if not item:
+                    logger.warning('Episode not found: %s', uri)
+                results[uri] = [self._make_track(item)] if item else []
+        return results
+
+    def _feed_episodes(self, program):
+        """Episodes of the stored feed of a program, newest first"""
+        xml = ivooxapi.parse_feed_xml(program)
+        try:
+            feed = self.feed_cache.get(xml)
+        except Exception as ex:
+            logger.warning('Error loading iVoox feed %s: %s', xml, ex)
+            return []
+        return ivooxapi.parse_feed_episodes(
+            feed.content, program, self._episode_record) if feed else []
+
+    def get_images(self, uris):
+        images = {}
+        for uri in uris:
+            base, code, _ = parse_uri(uri)
+            if base != URI_EPISODE['uri'] or not code:
+                continue
+            item = self._episodes.get(code.partition(':')[2])
+            if item and item.image:
+                images[uri] = [models.Image(uri=item.image)]
+        return images
 
     def search(self, query=None, uris=None, exact=False):
-        return None
+        if not query:
+            return None
+        if uris and not any(uri.startswith(URI_SCHEME) for uri in uris):
+            return None
 
-    def _make_podcast_uri(self, xml, ep_guid=None):
+        # Terms searched for each type, after the fields they were given in
+        terms = collections.defaultdict(list)
+        for field, values in query.iteritems():
+            for type in SEARCH_FIELDS.get(field, SEARCH_TYPES):
+                terms[type].extend(values)
+        terms = {type: ' '.join(values) for type, values in terms.items()}
+        logger.debug('Searching iVoox for: %s', terms)
+
+        limits = [(type, limit) for type, limit in [
+            ('episodes', self.config['max_episodes']),
+            ('programs', self.config['max_programs']),
+            ('channels', self.config['max_programs'])] if terms.get(type)]
+        with self.metrics.timer('search', 'local'):
+            local = [self.ivoox.search_local(terms[type], type=type,
+                                             max_items=limit, exact=exact)
+                     for type, limit in limits]
+
+        # iVoox is only asked for the types with too few local hits
+        missing = [(type, limit) for (type, limit), hits
+                   in zip(limits, local)
+                   if len(hits) < min(limit, LOCAL_SEARCH_HITS)]
+        remote = dict(zip([type for type, _ in missing], self.ivoox.parallel(*[
+            partial(self.ivoox.search, terms[type], type=type,
+                    max_items=limit, exact=exact)
+            for type, limit in missing])))
+
+        results = {type: _merge(hits, remote.get(type, []), limit)
+                   for (type, limit), hits in zip(limits, local)}
+        episodes, programs, channels = [
+            results.get(type, []) for type in SEARCH_TYPES]
+
+        return models.SearchResult(
+            uri=URI_SEARCH['uri'],
+            tracks=self._translate_tracks(episodes),
+            albums=self._translate_albums(programs),
+            artists=self._translate_channels(channels))
+
+    def _paginate(self, fetch, page, size):
+        """Items of a browse page, whether more items follow them, and the
+        call fetching the iVoox page that the next browse page starts on.
+
+        Browse pages hold the items of an iVoox page (`fetch(page=n)`),
+        or `size` of them if fewer, so none is skipped when iVoox lists
+        more items on a page than shown.
+        """
+        first = fetch(page=1)
+        # Page size of iVoox, as long as the first page is not the last
+        per_page = len(first) or size
+        # Shorter first pages may be the only one
+        is_last = per_page < size
+        size = min(size, per_page)
+        start = (page - 1) * size
+        ivoox_page, offset = divmod(start, per_page)
+        ivoox_page += 1
+
+        items = []
+        while True:
+            results = first if ivoox_page == 1 else fetch(page=ivoox_page)
+            end = offset + size - len(items)
+            items += results[offset:end]
+            if len(items) >= size or len(results) < per_page:
+                break
+            ivoox_page, offset = ivoox_page + 1, 0
+            is_last = False
+
+        if len(results) > end:
+            more = True
+        elif len(results) < per_page:
+            more = False
+        elif is_last:
+            # Only the next page tells, and iVoox may repeat the last one
+            following = fetch(page=ivoox_page + 1)
+            more = bool(following) and following != results
+        else:
+            more = True
+        return items, more, partial(fetch, page=(start + size) // per_page + 1)
+
+    def _prefetch(self, *calls):
+        # Next pages are likely to be browsed next
+        if self.warmer:
+            for call in calls:
+                self.warmer.prefetch(call)
+
+    def _index_episodes(self, items):
+        for item in items:
+            if item.guid:
+                self._episodes.set(item.guid, item, EPISODE_TTL)
+
+    def _make_episode_uri(self, item):
+        return '{}:{}:{}'.format(URI_EPISODE['uri'],
+                                 item.program_code or '', item.guid)
+
+    def _make_track(self, item):
+        return models.Track(
+            name=item.name,
+            uri=self._make_episode_uri(item),
+            length=item.duration * 1000 if item.duration else None,
+            date=ivooxapi.parse_date(item.date),
+            comment=item.description,
+            genre=item.genre,
+            album=models.Album(
+                name=item.program,
+                uri=self._make_podcast_uri(item.xml)))
+
+    def _make_podcast_uri(self, xml):
         if not xml:
             return None
-        # Feeds use main URL, not localized
-        baseurl = ivooxapi.get_baseurl()
-        program = uritools.urijoin(baseurl, xml)
-        episode = '#' + uritools.urijoin(baseurl, ep_guid) if ep_guid else ''
-        return 'podcast+{}{}'.format(program, episode)
+        try:
+            return self._podcast_uris[xml]
+        except KeyError:
+            if len(self._podcast_uris) >= ivooxapi.MEMO_SIZE:
+                self._podcast_uris.clear()
+            code = ivooxapi.parse_feed_code(xml) \
+                if self.config['feed_proxy'] else None
+            if code:
+                uri = make_uri(URI_PROGRAM['uri'], code)
+            else:
+                uri = 'podcast+' + self.feeds.absolute(xml)
+            self._podcast_uris[xml] = uri
+            return uri
 
     def _translate_menu(self, *items):
         return [models.Ref.directory(
@@ -133,30 +576,90 @@ class IVooxLibraryProvider(backend.LibraryProvider):
         ]
 
     def _translate_episodes(self, items):
+        items = items[0:self.config['max_episodes']]
+        self._index_episodes(items)
         return [models.Ref.track(
-                    name=item['name'],
-                    uri=self._make_podcast_uri(item['xml'], item['guid'])
-                ) for item in items[0:self.config['max_episodes']]
+                    name=item.name,
+                    uri=self._make_episode_uri(item)
+                ) for item in items
         ]
 
     def _translate_programs(self, items, info_field=None):
         return [models.Ref.album(
-                    name=item['name'] + (' ({})'.format(item[info_field])
-                        if info_field and item.get(info_field) else ''),
-                    uri=self._make_podcast_uri(item['xml'])
+                    name=item.name + (
+                        ' ({})'.format(getattr(item, info_field))
+                        if info_field and getattr(item, info_field) else ''),
+                    uri=self._make_podcast_uri(item.xml)
                 ) for item in items[0:self.config['max_programs']]
         ]
 
+    def _translate_subscriptions(self, page):
+        size = self.config['max_programs']
+        programs = self.subscriptions.programs()
+        refs = [models.Ref.album(
+                    name=item.name + (
+                        ' ({})'.format(item.new_audios)
+                        if item.new_audios else ''),
+                    uri=make_uri(URI_SUBS['uri'], item.code))
+                for item in programs[(page - 1) * size:page * size]]
+        if len(programs) > page * size:
+            refs.append(models.Ref.directory(
+                name=URI_MORE[self.config['lang']],
+                uri=make_uri(URI_SUBS['uri'], page=page + 1)))
+        return refs
+
+    def _translate_tracks(self, items):
+        items = items[0:self.config['max_episodes']]
+        self._index_episodes(items)
+        return [self._make_track(item) for item in items]
+
+    def _translate_albums(self, items):
+        return [models.Album(name=item.name,
+                             uri=self._make_podcast_uri(item.xml),
+                             num_tracks=item.audios or None)
+                for item in items[0:self.config['max_programs']]]
+
+    def _translate_channels(self, items):
+        return [models.Artist(name=item.name,
+                              uri=URI_CHANNEL['uri'] + ':' + item.code)
+                for item in items]
+
     def _translate_categories(self, items):
         return [models.Ref.directory(
-                    name=item['name'],
-                    uri=URI_EXPLORE['uri'] + ':' + item['code']
+                    name=item.name,
+                    uri=URI_EXPLORE['uri'] + ':' + item.code
                 ) for item in items
         ]
 
     def _translate_lists(self, items):
         return [models.Ref.playlist(
-                    name=item['name'],
-                    uri=URI_LIST['uri'] + ':' + item['code']
+                    name=item.name,
+                    uri=URI_LIST['uri'] + ':' + item.code
                 ) for item in items
         ]
+
+
+class IVooxPlaybackProvider(backend.PlaybackProvider):
+
+    def __init__(self, audio, backend, resolver=None):
+        super(IVooxPlaybackProvider, self).__init__(audio, backend)
+        # Audio files are served from the main URL, not localized
+        self.audios = ivooxapi.get_url_context()
+        self.resolver = resolver or AudioResolver()
+
+    def translate_uri(self, uri):
+        url = self._audio_url(uri)
+        # Media location, if resolved while previous tracks played
+        return self.resolver.get(url) if url else None
+
+    def prefetch(self, uris):
+        """Resolve in the background the audio urls of episodes"""
+        self.resolver.prefetch([url for url in map(self._audio_url, uris)
+                                if url])
+
+    def _audio_url(self, uri):
+        base, code, _ = parse_uri(uri)
+        if base != URI_EPISODE['uri'] or not code:
+            return None
+        guid = code.partition(':')[2]
+        return self.audios.absolute(ivooxapi.format_url('URL_AUDIO', guid))
@@ -0,0 +1,70 @@
+from __future__ import unicode_literals
+
+import logging
+import threading
+import time
+
+import requests
+
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of requesting an endpoint whose circuit is open"""
+
+
+class CircuitBreaker(object):
+    """Thread-safe circuit breakers, one for each key (API_URLS item).
+
+    After `threshold` consecutive failures the circuit of a key opens, and
+    no requests are allowed for `cooldown` seconds. Then a single trial
+    request is let through: the circuit closes if it succeeds, and opens
+    again if it fails. A threshold of 0 never opens any circuit.
+    """
+
+    def __init__(self, threshold=5, cooldown=60, clock=time.time):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Consecutive failures, and time the circuit opened, by key
+        self._failures = {}
+        self._opened = {}
+
+    def allow(self, key):
+        """Whether a request for key may be made right now"""
+        with self._lock:
+            opened = self._opened.get(key)
+            if opened is None:
+                return True
+            if self._clock() - opened < self.cooldown:
+                return False
+            # Half open: the other requests wait for this trial
+            self._opened[key] = self._clock()
+            return True
+
+    def success(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+            if self._opened.pop(key, None) is not None:
+                logger.info('iVoox %s is back, circuit closed', key)
+
+    def failure(self, key):
+        if not self.threshold:
+            return
+        with self._lock:
+            failures = self._failures[key] = self._failures.get(key, 0) + 1
+            if failures >= self.threshold:
+                if key not in self._opened:
+                    logger.warning('iVoox %s failed %d times in a row, '
+                                   'circuit open for %d seconds',
+                                   key, failures, self.cooldown)
+                self._opened[key] = self._clock()
+
+    def state(self):
+        """Consecutive failures, and whether the circuit is open, by key"""
+        with self._lock:
+            return {key: {'failures': failures,
+                          'open': key in self._opened}
+                    for key, failures in self._failures.iteritems()}
@@ -2,79 +2,438 @@
 # -*- coding: utf8 -*-
 from __future__ import unicode_literals, print_function
 
+import collections
+import functools
+import hashlib
+import inspect
+import json
 import logging
+import multiprocessing
 import requests
+import threading
+import time
 import uritools
+from multiprocessing.pool import ThreadPool
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 
 import ivooxapi
+from breaker import CircuitBreaker, CircuitOpenError
+from cache import ResponseCache, SingleFlight
+from metrics import Metrics
+from store import ScrapStore
 from scrapper import Scrapper
 
 
 logger = logging.getLogger(__name__)
 
+_MISSING = object()
+
+# Per thread flag set when scrap_url serves results pending revalidation
+_context = threading.local()
+
+# Scrapper types whose results are never served from the store
+VOLATILE_TYPES = ('login',)
+
+# Status codes of a failing iVoox, rather than of a missing page
+FAILURE_STATUS = (429, 500, 502, 503, 504)
+
+
+# Time to live (seconds) of the cached results of each client method
+CACHE_TTL = {
+    'get_categories': 6 * 60 * 60,
+    'get_user_lists': 30 * 60,
+    'get_subscriptions': 5 * 60,
+    'explore_list': 10 * 60,
+    'explore': 30 * 60,
+    'explore_channel': 30 * 60,
+    'get_program_episodes': 30 * 60,
+    '_search': 30 * 60,
+}
+
+
+def _is_login_url(url):
+    page = uritools.urisplit(url).path.rsplit('/', 1)[-1]
+    return ivooxapi.parse_endpoint(page) == 'LOGIN'
+
+
+def _exact_matches(items, query):
+    # Items named just as searched, regardless of case and accents
+    name = ivooxapi.normalize_text(query)
+    return [item for item in items
+            if ivooxapi.normalize_text(item.name or '') == name]
+
 
 def _cache(method):
+    name = method.__name__
+
+    @functools.wraps(method)
     def cached_method(self, *args, **kwargs):
-        if len(args) != 0 or any(parms is not None for parms in kwargs.itervalues()):
-            return method(self, *args, **kwargs)
-        if method not in self._cache:
-            self._cache[method] = method(self, *args, **kwargs)
-            logger.debug('Caching results of %r: %s', method, self._cache[method])
+        params = inspect.getcallargs(method, self, *args, **kwargs)
+        del params['self']
+        key = (name, tuple(sorted(params.items())),
+               self.lang, self.country, self.user)
+
+        results = self._cache.get(key, _MISSING)
+        if results is _MISSING:
+            _context.stale = False
+            results = method(self, *args, **kwargs)
+            if _context.stale:
+                # Not cached, so the revalidated results are used next time
+                logger.debug('Using stored results of %s%r', name, key[1])
+                return results
+            self._cache.set(key, results, CACHE_TTL[name])
+            logger.debug('Caching results of %s%r', name, key[1])
         else:
-            logger.debug('Getting results of %r from cache', method)
-        return self._cache[method]
+            logger.debug('Getting results of %s%r from cache', name, key[1])
+        return results
     return cached_method
 
 
 class IVooxClient(object):
 
-    def __init__(self, lang='ES', country='ES'):
+    def __init__(self, lang='ES', country='ES', workers=4, cache_size=256,
+                 pool_size=10, timeout=(5, 15), retries=3, store=None,
+                 baseurl=None, metrics=None, index=None,
+                 latency_budget=None, error_budget=5, breaker_cooldown=60):
         super(IVooxClient, self).__init__()
-        self.session = None
-        self._cache = {}
+        self.store = store if store is not None else ScrapStore()
+        # Search index fed with the items scraped, if any
+        self.index = index
+        self.metrics = metrics or Metrics()
+        # Seconds waited for iVoox before serving stored results instead
+        self.latency_budget = latency_budget
+        self.breaker = CircuitBreaker(threshold=error_budget,
+                                      cooldown=breaker_cooldown)
+        # Per API_URLS item count of requests saved by stored results
+        self.savings = collections.defaultdict(lambda: {
+            'not_modified': 0, 'unchanged': 0,
+            'bytes_saved': 0, 'parse_time_saved': 0.0})
+        self._lock = threading.Lock()
+        self._searches = SingleFlight()
+        self._scraps = SingleFlight()
+        self._logins = SingleFlight()
+        self._seen = set()
+        self._revalidating = set()
+        self._revalidated = set()
+        self._records = {}
+        self.session = self._create_session(pool_size, retries)
+        self.timeout = timeout
+        self.user = None
+        self._logged = False
+        self._credentials = None
+        self._cache = ResponseCache(maxsize=cache_size)
+        self._pool = ThreadPool(processes=workers)
+        # Fetches waited on within the latency budget, on their own pool
+        # as they are often waited on from the workers of the main one
+        self._fetch_pool = ThreadPool(processes=workers)
         self.lang = lang
         self.country = country
+        self.urls = ivooxapi.UrlContext(baseurl) if baseurl \
+            else ivooxapi.get_url_context(lang=lang, country=country)
 
     @property
     def baseurl(self):
-        return ivooxapi.get_baseurl(lang=self.lang,
-                                    country=self.country)
+        return self.urls.baseurl
+
+    def parallel(self, *calls):
+        """Run the given callables on the client worker pool.
+
+        Returns their results in the same order the calls were given.
+        Exceptions raised by any call are propagated to the caller.
+        """
+        pending = [self._pool.apply_async(call) for call in calls]
+        return [result.get() for result in pending]
+
+    def close(self):
+        self._pool.terminate()
+        self._fetch_pool.terminate()
+        self._pool.join()
+        self._fetch_pool.join()
+        self.session.close()
+        self.store.close()
 
     def login(self, user, password):
-        if not (user and password):
+        # Kept to log in again when the session expires
+        self._credentials = (user, password) if user and password else None
+        if not self._credentials:
+            self._logged = False
             return False
 
         login_url = self._absolute_url(ivooxapi.format_url('LOGIN'))
-        self.session = requests.session()
-        self.clear_cache()
+        self.session.cookies.clear()
 
         try:
-            self.session.get(login_url)
-            self.session.post(login_url,
-                              data={'at-user': user,
-                                    'at-pw': password,
-                                    'redir': self.baseurl})
+            self.session.get(login_url, timeout=self.timeout)
+            response = self.session.post(login_url,
+                                         data={'at-user': user,
+                                               'at-pw': password,
+                                               'redir': self.baseurl},
+                                         timeout=self.timeout,
+                                         stream=True)
+
+            # Results scrapped while logging in were anonymous
+            self.user = user
+            self.clear_cache()
 
+            # Login redirects to the home page: just look for its navbar
+            scrapper = ivooxapi.get_scrapper(type='login',
+                                             session=self.session)
+            userinfo = list(scrapper.iterparse(response, max_items=1))
+            self._logged = self._parse_login(userinfo)
             return self.user_logged()
 
         except Exception as ex:
             logger.error('Login error on %s: %s', self.baseurl, ex)
+            self.user = None
+            self._logged = False
             return False
 
-    @_cache
     def user_logged(self):
-        userinfo = self.scrap_url(
-            url=ivooxapi.format_url('EXPLORE_EPISODES', 'f', 1),
-            scrapper=ivooxapi.CheckLogin(session=self.session))
-        return userinfo[0]['user'] is not None
-
-    def scrap_url(self, url, type=None, scrapper=None):
-        if not scrapper:
-            scrapper = ivooxapi.get_scrapper(type=type, session=self.session)
+        """Login state, as tracked from the session responses.
+
+        Only when it is unknown, the navbar of the home page is probed.
+        """
+        if self._logged is None:
+            userinfo = self.scrap_url(url=ivooxapi.format_url('LIST_HOME'),
+                                      type='login',
+                                      max_items=1)
+            self._logged = self._parse_login(userinfo)
+        return self._logged
+
+    def _parse_login(self, userinfo):
+        if userinfo:
+            return userinfo[0].user is not None
+        # No navbar found: only a session without cookies is surely out
+        return None if self.session.cookies else False
+
+    def scrap_url(self, url, type, max_items=None, **options):
+        endpoint = ivooxapi.parse_endpoint(url)
+        url = self._absolute_url(url)
+        request = (url, endpoint, type, max_items, options)
+        key = json.dumps([url, type, max_items,
+                          sorted(options.items()), self.user])
+
+        # Concurrent scraps of the same page share a single request
+        results, stale = self._scraps.do(key, self._scrap, key, request)
+        if stale:
+            _context.stale = True
+        return results
+
+    @property
+    def merged_requests(self):
+        return self._scraps.merged
+
+    def _scrap(self, key, request):
+        if request[2] in VOLATILE_TYPES:
+            return self._fetched(self._fetch(*request))
+
+        entry, stale = self._get_stored(key, request)
+        if entry:
+            return entry.items, stale
+
+        # Last good results, served while iVoox is failing or too slow
+        stored = self._stored(key, request) if self.latency_budget else None
+        try:
+            if stored is None:
+                return self._fetched(self._fetch(*request, key=key))
+            late = threading.Event()
+            pending = self._fetch_pool.apply_async(self._fetch_within, (
+                key, request, late))
+            return self._fetched(pending.get(timeout=self.latency_budget),
+                                 stored)
+        except multiprocessing.TimeoutError:
+            late.set()
+            reason = 'over latency budget'
+        except requests.RequestException as ex:
+            stored = stored or self._stored(key, request)
+            if stored is None:
+                raise
+            reason = ex
+        logger.warning('Serving stored results of %s: %s', request[0], reason)
+        return stored.items, True
+
+    @staticmethod
+    def _fetched(results, stored=None):
+        # Pages of an expired session are neither cached nor stored
+        if results is None:
+            return (stored.items if stored else []), True
+        return results, False
+
+    def _fetch_within(self, key, request, late):
+        results = self._fetch(*request, key=key)
+        if late.is_set():
+            # Too late for the caller, so served on the next call
+            with self._lock:
+                self._revalidated.add(key)
+        return results
+
+    def _get_stored(self, key, request):
+        # Results stored on a previous run are served once right away,
+        # while they are fetched again in the background
+        with self._lock:
+            if key in self._revalidated:
+                self._revalidated.discard(key)
+                return self._stored(key, request), False
+            if key in self._revalidating:
+                return self._stored(key, request), True
+            if key in self._seen:
+                return None, False
+            self._seen.add(key)
+
+        entry = self._stored(key, request)
+        if entry:
+            logger.debug('Revalidating stored results of %s', request[0])
+            with self._lock:
+                self._revalidating.add(key)
+            self._pool.apply_async(self._revalidate, request, {'key': key})
+        return entry, entry is not None
+
+    def _stored(self, key, request):
+        return self.store.get(key, record=self._record(request[2],
+                                                       request[4]))
+
+    def _record(self, type, options=None):
+        record = self._records.get(type)
+        if record is None:
+            record = self._records[type] = ivooxapi.get_scrapper(
+                type=type, session=self.session, **(options or {})).record
+        return record
+
+    def _revalidate(self, url, endpoint, type, max_items, options, key):
+        try:
+            self._fetch(url, endpoint, type, max_items, options, key=key)
+            with self._lock:
+                # Unless refreshed meanwhile
+                if key in self._revalidating:
+                    self._revalidated.add(key)
+        except Exception as ex:
+            logger.warning('Error revalidating %s: %s', url, ex)
+        finally:
+            with self._lock:
+                self._revalidating.discard(key)
+
+    def _fetch(self, url, endpoint, type, max_items, options, key=None,
+               relogin=True):
+        """Fetch and parse url, None if it needs a session that expired"""
+        scrapper = ivooxapi.get_scrapper(type=type,
+                                         session=self.session,
+                                         timeout=self.timeout,
+                                         **options)
         logger.debug('Using %s to analize %s', scrapper.__class__.__name__, url)
-        results = scrapper.scrap(self._absolute_url(url))
+
+        if key is None:
+            return scrapper.scrap(url, max_items=max_items)
+
+        # Conditional request with the validators of the stored results
+        entry = self.store.get(key)
+        headers = {}
+        if entry and entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry and entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+
+        if not self.breaker.allow(endpoint):
+            raise CircuitOpenError(
+                'Too many errors on {}, not requested for now'.format(
+                    endpoint))
+
+        self.metrics.started(endpoint)
+        try:
+            with self.metrics.timer('fetch', endpoint):
+                try:
+                    response = scrapper.fetch(url, headers=headers)
+                    if response.status_code in FAILURE_STATUS:
+                        response.close()
+                        response.raise_for_status()
+                except requests.RequestException:
+                    self.breaker.failure(endpoint)
+                    raise
+            self.breaker.success(endpoint)
+            results = self._parse(scrapper, response, key, entry,
+                                  endpoint, type, max_items)
+        finally:
+            self.metrics.finished(endpoint)
+
+        if results is None and relogin and self._login_again():
+            return self._fetch(url, endpoint, type, max_items, options,
+                               key=key, relogin=False)
         return results
 
+    def _login_again(self):
+        if self._logged:
+            logger.warning('Session expired for %s', self.user)
+            self._logged = False
+        if not self._credentials:
+            return False
+        # Pages redirected at the same time share a single login
+        user, password = self._credentials
+        return self._logins.do(user, self.login, user, password)
+
+    def _parse(self, scrapper, response, key, entry, endpoint, type,
+               max_items):
+        with self._lock:
+            self._seen.add(key)
+
+        # Expired sessions get user pages redirected to login
+        if response.history and endpoint in ivooxapi.USER_ENDPOINTS and \
+                _is_login_url(response.url):
+            response.close()
+            return None
+
+        if entry and response.status_code == 304:
+            response.close()
+            return self._reuse(key, entry, endpoint, 'not_modified',
+                               scrapper.record, bytes_saved=entry.size or 0)
+
+        # Servers ignoring validators may still send the very same page,
+        # whose stored (and indexed) results are reused without parsing it
+        if entry and entry.digest:
+            try:
+                content = response.content
+            finally:
+                response.close()
+            if hashlib.sha1(content).hexdigest() == entry.digest:
+                return self._reuse(key, entry, endpoint, 'unchanged',
+                                   scrapper.record)
+
+        if self.metrics.enabled:
+            scrapper.extract_time = 0.0
+        start = time.time()
+        # Parsed from the body already read, if so
+        results = list(scrapper.iterparse(response, max_items=max_items,
+                                          digest=True))
+        parse_time = time.time() - start
+        if self.metrics.enabled:
+            self.metrics.record('parse', endpoint,
+                                parse_time - scrapper.extract_time)
+            self.metrics.record('extract', endpoint, scrapper.extract_time)
+
+        self.store.put(key, results,
+                       etag=response.headers.get('ETag'),
+                       last_modified=response.headers.get('Last-Modified'),
+                       digest=scrapper.digest,
+                       size=scrapper.size,
+                       parse_time=parse_time)
+        if self.index is not None:
+            # Off the browse path: writes batched in the background
+            self.index.add_later(type, results)
+        return results
+
+    def _reuse(self, key, entry, endpoint, reason, record, bytes_saved=0):
+        logger.debug('Reusing stored results of %s: %s', key, reason)
+        self.store.touch(key)
+        self._saved(endpoint, reason, bytes_saved=bytes_saved,
+                    parse_time_saved=entry.parse_time or 0)
+        return [record.from_dict(item) for item in entry.items]
+
+    def _saved(self, endpoint, reason, bytes_saved=0, parse_time_saved=0):
+        with self._lock:
+            savings = self.savings[endpoint]
+            savings[reason] += 1
+            savings['bytes_saved'] += bytes_saved
+            savings['parse_time_saved'] += parse_time_saved
+
     @_cache
     def get_categories(self, parent=None):
         parent = parent or 'f'
@@ -82,27 +441,25 @@ class IVooxClient(object):
 
         return self.scrap_url(
             url=explore_url,
-            scrapper=ivooxapi.get_scrapper(
-                type='categories',
-                main=(parent == 'f'),
-                session=self.session)
-            )
+            type='categories',
+            main=(parent == 'f'))
 
+    @_cache
     def get_user_lists(self):
         lists = self.scrap_url(
             url=ivooxapi.format_url('LIST_INDEX'),
-            scrapper=ivooxapi.get_scrapper(
-                type='lists',
-                session=self.session)
-            )
+            type='lists')
         return lists[2:]
 
-    def get_subscriptions(self):
+    @_cache
+    def get_subscriptions(self, max_items=None):
         return self.scrap_url(
             url=ivooxapi.format_url('SUBSCRIPTIONS'),
-            type='subscriptions')
+            type='subscriptions',
+            max_items=max_items)
 
-    def explore_list(self, code, page=1):
+    @_cache
+    def explore_list(self, code, page=1, max_items=None):
         if code in ['pending', 'favorites', 'history', 'home']:
             list_url = ivooxapi.format_url('LIST_{}'.format(code).upper(), page)
         else:
@@ -110,27 +467,112 @@ class IVooxClient(object):
 
         return self.scrap_url(
             url=list_url,
-            type='episodes')
+            type='episodes',
+            max_items=max_items)
+
+    @_cache
+    def explore_channel(self, code, page=1, max_items=None):
+        return self.scrap_url(
+            url=ivooxapi.format_url('EXPLORE_CHANNELS', code, page),
+            type='programs',
+            max_items=max_items)
+
+    @_cache
+    def get_program_episodes(self, code, max_items=None):
+        return self.scrap_url(
+            url=ivooxapi.format_url('URL_PROGRAM', code),
+            type='episodes',
+            max_items=max_items)
 
-    def explore(self, category=None, type='episodes', page=1):
+    @_cache
+    def explore(self, category=None, type='episodes', page=1, max_items=None):
         explore_url = ivooxapi.format_url(
             'EXPLORE_{}'.format(type.upper()),
             category or 'f',
             page)
         return self.scrap_url(
             url=explore_url,
-            type=type)
+            type=type,
+            max_items=max_items)
+
+    def search(self, search_item, type='episodes', page=1, max_items=None,
+               exact=False):
+        # Equivalent queries, e.g. repeated while typing, share the
+        # cached results or the request already in flight
+        query = ' '.join(search_item.lower().split())
+        return self._searches.do((query, type, page, max_items, exact),
+                                 self._search, query, type, page, max_items,
+                                 exact)
 
-    def search(self, search_item, type='episodes', page=1):
-        search_string = '-'.join(search_item.split()).lower()
+    @_cache
+    def _search(self, query, type, page, max_items, exact):
+        search_string = '-'.join(query.split())
         search_url = ivooxapi.format_url(
             'SEARCH_{}'.format(type.upper()),
             search_string,
             page)
-        return self.scrap_url(url=search_url, type=type)
+        results = self.scrap_url(url=search_url, type=type,
+                                 max_items=max_items)
+        return _exact_matches(results, query) if exact else results
+
+    def search_local(self, search_item, type='episodes', max_items=None,
+                     exact=False):
+        """Search the items scraped so far, without any request"""
+        if self.index is None:
+            return []
+        results = self.index.search(search_item, type=type, limit=max_items,
+                                    record=self._record(type))
+        return _exact_matches(results, search_item) if exact else results
+
+    def stats(self):
+        """Cache, request and timing figures of the client"""
+        cache = self._cache.stats()
+        lookups = cache['hits'] + cache['misses']
+        cache['hit_ratio'] = \
+            float(cache['hits']) / lookups if lookups else None
+        with self._lock:
+            savings = {endpoint: dict(figures) for endpoint, figures
+                       in self.savings.iteritems()}
+        stats = {'cache': cache,
+                 'merged_requests': self.merged_requests,
+                 'savings': savings,
+                 'breakers': self.breaker.state()}
+        stats.update(self.metrics.snapshot())
+        return stats
 
     def clear_cache(self):
-        self._cache = {}
+        self._cache.clear()
+        # Pages already seen are fetched (conditionally) before answering,
+        # not served as stored again, nor as revalidated before the refresh
+        with self._lock:
+            self._revalidated.clear()
+            self._revalidating.clear()
+
+    def invalidate(self, method, **params):
+        """Drop cached results of `method` called with matching `params`"""
+        def matches(key):
+            if key[0] != method:
+                return False
+            cached_params = dict(key[1])
+            return all(cached_params.get(name) == value
+                       for name, value in params.iteritems())
+
+        self._cache.invalidate(matches)
+
+    @staticmethod
+    def _create_session(pool_size, retries):
+        # One long-lived session shared by every scrapper, so connections
+        # to iVoox are kept alive and reused between requests
+        session = requests.session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(total=retries,
+                              backoff_factor=0.5,
+                              status_forcelist=(500, 502, 503, 504)))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
 
     def _absolute_url(self, relurl):
-        return uritools.urijoin(self.baseurl, relurl)
+        return self.urls.absolute(relurl)
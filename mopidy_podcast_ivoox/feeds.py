@@ -0,0 +1,224 @@
+from __future__ import unicode_literals
+
+import collections
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+
+import requests
+from lxml import etree
+
+import ivooxapi
+from cache import SingleFlight
+from metrics import Metrics
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 2
+
+# Seconds a feed is served without asking iVoox whether it changed
+FEED_TTL = 30 * 60
+
+# Pages of a feed fetched at most, should iVoox never list an empty one
+MAX_FEED_PAGES = 500
+
+Feed = collections.namedtuple(
+    'Feed', ['content', 'fetched', 'etag', 'last_modified', 'digest'])
+
+
+class FeedCache(object):
+    """Complete program feeds of iVoox, kept zlib-compressed in sqlite.
+
+    Feeds are built from the pages of their paginated variant, newest
+    episodes first. Every page is fetched the first time a program is
+    opened. Afterwards only the first page is revalidated, with
+    conditional requests once the feed has been served for `ttl` seconds.
+    Its new episodes go on top of the stored ones, and older pages are
+    only fetched again down to an episode already stored. If iVoox fails,
+    the stored feed is served. Only the most recently fetched `max_feeds`
+    feeds are kept.
+    """
+
+    def __init__(self, session, urls, path=':memory:', ttl=FEED_TTL,
+                 timeout=(5, 15), metrics=None, max_feeds=100):
+        self.max_feeds = max_feeds
+        self._session = session
+        self._urls = urls
+        self._ttl = ttl
+        self._timeout = timeout
+        self._metrics = metrics or Metrics()
+        self._lock = threading.Lock()
+        self._fetches = SingleFlight()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            version, = self._db.execute('PRAGMA user_version').fetchone()
+            if version != SCHEMA_VERSION:
+                self._db.execute('DROP TABLE IF EXISTS feeds')
+                self._db.execute(
+                    'PRAGMA user_version = {:d}'.format(SCHEMA_VERSION))
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS feeds ('
+                ' url TEXT PRIMARY KEY,'
+                ' content BLOB NOT NULL,'
+                ' fetched REAL NOT NULL,'
+                ' etag TEXT,'
+                ' last_modified TEXT,'
+                ' digest TEXT NOT NULL)')
+            self._count, = self._db.execute(
+                'SELECT COUNT(*) FROM feeds').fetchone()
+
+    def __len__(self):
+        return self._count
+
+    def get(self, xml):
+        """Return the Feed of a complete program feed, None if missing"""
+        url = self._urls.absolute(ivooxapi.format_feed_page(xml, 1))
+        feed = self._load(url)
+        if feed and time.time() - feed.fetched < self._ttl:
+            return feed
+        # Players opening the same program share a single request
+        return self._fetches.do(url, self._fetch, xml, url, feed)
+
+    def expire(self, xml):
+        """Revalidate a feed the next time it is served"""
+        url = self._urls.absolute(ivooxapi.format_feed_page(xml, 1))
+        with self._lock, self._db:
+            self._db.execute('UPDATE feeds SET fetched = 0 WHERE url = ?',
+                             (url,))
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM feeds')
+            self._count = 0
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _fetch(self, xml, url, feed):
+        headers = {}
+        if feed and feed.etag:
+            headers['If-None-Match'] = feed.etag
+        if feed and feed.last_modified:
+            headers['If-Modified-Since'] = feed.last_modified
+
+        try:
+            response = self._get(url, headers)
+            if response is None:
+                return None
+            if feed and (response.status_code == 304 or
+                         _digest(response.content) == feed.digest):
+                logger.debug('Feed not modified: %s', url)
+                self._touch(url)
+                return feed
+            content = self._merge(xml, response.content, feed)
+        except (requests.RequestException, etree.XMLSyntaxError) as ex:
+            if feed is None:
+                raise
+            logger.warning('Serving stored feed %s: %s', url, ex)
+            return feed
+
+        feed = Feed(content=content,
+                    fetched=time.time(),
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified'),
+                    digest=_digest(response.content))
+        self._store(url, feed)
+        return feed
+
+    def _get(self, url, headers=None):
+        with self._metrics.timer('fetch', 'XML_PROGRAM_PAGE'):
+            response = self._session.get(url, headers=headers,
+                                         timeout=self._timeout)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response
+
+    def _merge(self, xml, content, feed):
+        # The first page, with the episodes of the older ones after its own
+        document = _parse(content)
+        channel = document.find('channel')
+        if channel is None:
+            return content
+        items = channel.findall('item')
+        stored = _items(_parse(feed.content)) if feed else []
+        known = set(_guid(item) for item in stored)
+
+        guids = set(_guid(item) for item in items)
+        page = 1
+        while items and page < MAX_FEED_PAGES and guids.isdisjoint(known):
+            page += 1
+            response = self._get(self._urls.absolute(
+                ivooxapi.format_feed_page(xml, page)))
+            older = [item for item in _items(_parse(response.content))
+                     if _guid(item) not in guids] if response else []
+            if not older:
+                # Last page, or iVoox listing it again
+                break
+            for item in older:
+                channel.append(item)
+                guids.add(_guid(item))
+        logger.debug('Fetched %d pages of feed %s', page, xml)
+
+        for item in stored:
+            if _guid(item) not in guids:
+                channel.append(item)
+        return etree.tostring(document, xml_declaration=True,
+                              encoding='utf-8')
+
+    def _load(self, url):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT content, fetched, etag, last_modified, digest'
+                ' FROM feeds WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        return Feed(zlib.decompress(row[0]), *row[1:])
+
+    def _store(self, url, feed):
+        with self._lock, self._db:
+            stored = self._db.execute(
+                'SELECT 1 FROM feeds WHERE url = ?', (url,)).fetchone()
+            self._db.execute(
+                'INSERT OR REPLACE INTO feeds VALUES (?, ?, ?, ?, ?, ?)',
+                (url, sqlite3.Binary(zlib.compress(feed.content)),
+                 feed.fetched, feed.etag, feed.last_modified, feed.digest))
+            if not stored:
+                self._count += 1
+            if self._count > self.max_feeds:
+                self._prune(self._count - self.max_feeds)
+
+    def _touch(self, url):
+        with self._lock, self._db:
+            self._db.execute('UPDATE feeds SET fetched = ? WHERE url = ?',
+                             (time.time(), url))
+
+    def _prune(self, count):
+        # Least recently fetched feeds go first
+        urls = [(url,) for url, in self._db.execute(
+            'SELECT url FROM feeds ORDER BY fetched LIMIT ?', (count,))]
+        self._db.executemany('DELETE FROM feeds WHERE url = ?', urls)
+        self._count -= len(urls)
+
+
+def _digest(content):
+    return hashlib.sha1(content).hexdigest()
+
+
+def _parse(content):
+    # Huge feeds are expected, with long episode descriptions
+    return etree.fromstring(content, parser=etree.XMLParser(huge_tree=True))
+
+
+def _items(document):
+    channel = document.find('channel')
+    return channel.findall('item') if channel is not None else []
+
+
+def _guid(item):
+    return item.findtext('guid') or item.findtext('link')
@@ -0,0 +1,56 @@
+from __future__ import unicode_literals
+
+import logging
+
+import pykka
+from mopidy import core
+
+from .backend import IVooxBackend, URI_EPISODE
+
+
+logger = logging.getLogger(__name__)
+
+
+class IVooxFrontend(pykka.ThreadingActor, core.CoreListener):
+    """Get the audio of the next iVoox episodes in the tracklist resolved.
+
+    On every track change, and tracklist change, the audio urls of the
+    iVoox episodes among the next `prefetch_tracks` tracks to be played
+    are resolved by the iVoox backend in the background, so their
+    playback starts without redirects.
+    """
+
+    def __init__(self, config, core):
+        super(IVooxFrontend, self).__init__()
+        self.core = core
+        self.count = config['podcast-ivoox']['prefetch_tracks']
+
+    def track_playback_started(self, tl_track):
+        self._prefetch_next()
+
+    def tracklist_changed(self):
+        self._prefetch_next()
+
+    def _prefetch_next(self):
+        if not self.count:
+            return
+        # Tracks as they will be played, with repeat, random and single
+        current = self.core.playback.get_current_tl_track().get()
+        tl_track = self.core.tracklist.eot_track(current).get()
+        uris = []
+        # The current track is already resolved
+        seen = {current.tlid} if current else set()
+        for _ in range(self.count):
+            if not tl_track or tl_track.tlid in seen:
+                break
+            seen.add(tl_track.tlid)
+            if tl_track.track.uri.startswith(URI_EPISODE['uri']):
+                uris.append(tl_track.track.uri)
+            tl_track = self.core.tracklist.eot_track(tl_track).get()
+        if not uris:
+            return
+
+        backends = pykka.ActorRegistry.get_by_class(IVooxBackend)
+        if backends:
+            logger.debug('Resolving next iVoox episodes: %s', uris)
+            backends[0].proxy().playback.prefetch(uris)
@@ -0,0 +1,249 @@
+from __future__ import unicode_literals
+
+import Queue
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import ivooxapi
+from store import _to_json
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 2
+
+# Scrapper types indexed, and the weight of a match on each of their fields
+INDEXED_FIELDS = {
+    'episodes': (('name', 3), ('program', 2), ('genre', 1),
+                 ('description', 1)),
+    'programs': (('name', 3), ('description', 1)),
+    'channels': (('name', 3),),
+}
+
+
+def tokenize(text):
+    """Accent and case insensitive words of a text, as indexed"""
+    if not text:
+        return []
+    return [word for word in ivooxapi.normalize_text(text).split()
+            if len(word) > 1 or word.isdigit()]
+
+
+class SearchIndex(object):
+    """Inverted index of the episodes, programs and channels scraped.
+
+    Every word of the indexed fields of an item points to the item, with
+    the weight of the field it was found in. Items are identified by type
+    and url, so scraping them again just updates them. Only the most
+    recently updated `max_items` items are kept.
+
+    Items of an iVoox site are not found on the others, so the index is
+    cleared when opened for a `site` other than the one it was built for.
+
+    Items queued with `add_later` are indexed by a background writer, in
+    a single transaction with those queued meanwhile.
+    """
+
+    def __init__(self, path=':memory:', max_items=50000, site=None):
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._pending = Queue.Queue()
+        self._writer = None
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            version, = self._db.execute('PRAGMA user_version').fetchone()
+            if version != SCHEMA_VERSION:
+                self._db.execute('DROP TABLE IF EXISTS terms')
+                self._db.execute('DROP TABLE IF EXISTS items')
+                self._db.execute('DROP TABLE IF EXISTS info')
+                self._db.execute(
+                    'PRAGMA user_version = {:d}'.format(SCHEMA_VERSION))
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS items ('
+                ' id INTEGER PRIMARY KEY,'
+                ' type TEXT NOT NULL,'
+                ' url TEXT NOT NULL,'
+                ' item TEXT NOT NULL,'
+                ' updated REAL NOT NULL,'
+                ' UNIQUE (type, url))')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS terms ('
+                ' type TEXT NOT NULL,'
+                ' term TEXT NOT NULL,'
+                ' item INTEGER NOT NULL,'
+                ' weight INTEGER NOT NULL)')
+            self._db.execute(
+                'CREATE INDEX IF NOT EXISTS terms_term ON terms (type, term)')
+            self._db.execute(
+                'CREATE INDEX IF NOT EXISTS terms_item ON terms (item)')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS info ('
+                ' name TEXT PRIMARY KEY,'
+                ' value TEXT NOT NULL)')
+            if site is not None:
+                self._set_site(site)
+            self._count, = self._db.execute(
+                'SELECT COUNT(*) FROM items').fetchone()
+
+    def __len__(self):
+        return self._count
+
+    def add(self, type, items):
+        """Index (or update) scraped items of an indexed type"""
+        self._write([(type, items)])
+
+    def add_later(self, type, items):
+        """Index scraped items in the background"""
+        if type not in INDEXED_FIELDS:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run_writer,
+                                                name='IVooxIndexWriter')
+                self._writer.daemon = True
+                self._writer.start()
+        self._pending.put((type, items))
+
+    def flush(self):
+        """Wait for the items queued to be indexed"""
+        self._pending.join()
+
+    def _run_writer(self):
+        while True:
+            batches = [self._pending.get()]
+            # Whatever was queued meanwhile goes in the same transaction
+            while batches[-1] is not None:
+                try:
+                    batches.append(self._pending.get_nowait())
+                except Queue.Empty:
+                    break
+            try:
+                self._write([batch for batch in batches if batch])
+            except Exception as ex:
+                logger.warning('Error indexing iVoox items: %s', ex)
+            for _ in batches:
+                self._pending.task_done()
+            if batches[-1] is None:
+                return
+
+    def _write(self, batches):
+        now = time.time()
+        with self._lock, self._db:
+            for type, items in batches:
+                self._add(type, items, now)
+            if self._count > self.max_items:
+                self._prune(self._count - self.max_items)
+
+    def _add(self, type, items, now):
+        fields = INDEXED_FIELDS.get(type)
+        if not fields:
+            return
+        for item in items:
+            url = item.get('url')
+            if not url:
+                continue
+            terms = {}
+            for field, weight in fields:
+                for term in tokenize(item.get(field)):
+                    terms[term] = max(weight, terms.get(term, 0))
+
+            data = json.dumps(item, default=_to_json)
+            row = self._db.execute(
+                'SELECT id FROM items WHERE type = ? AND url = ?',
+                (type, url)).fetchone()
+            if row:
+                id, = row
+                self._db.execute(
+                    'UPDATE items SET item = ?, updated = ? WHERE id = ?',
+                    (data, now, id))
+                self._db.execute('DELETE FROM terms WHERE item = ?', (id,))
+            else:
+                id = self._db.execute(
+                    'INSERT INTO items (type, url, item, updated)'
+                    ' VALUES (?, ?, ?, ?)',
+                    (type, url, data, now)).lastrowid
+                self._count += 1
+            self._db.executemany(
+                'INSERT INTO terms VALUES (?, ?, ?, ?)',
+                [(type, term, id, weight)
+                 for term, weight in terms.items()])
+
+    def search(self, query, type='episodes', limit=None, record=None):
+        """Items of `type` matching every word of the query, best first.
+
+        The last word also matches longer words, as queries are typed.
+        Items are returned as dicts, or of type `record` if given.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        scores = None
+        with self._lock:
+            for position, term in enumerate(terms):
+                if position == len(terms) - 1:
+                    condition, args = 'term >= ? AND term < ?', \
+                        (type, term, term + '\uffff')
+                else:
+                    condition, args = 'term = ?', (type, term)
+                matches = dict(self._db.execute(
+                    'SELECT item, MAX(weight) FROM terms'
+                    ' WHERE type = ? AND ' + condition +
+                    ' GROUP BY item', args))
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {id: score + matches[id]
+                              for id, score in scores.iteritems()
+                              if id in matches}
+                if not scores:
+                    return []
+
+            # Best scores first, in scrap order among equals
+            ids = sorted(scores, key=lambda id: (-scores[id], id))[:limit]
+            rows = {}
+            # Bounded number of parameters on each query, as sqlite needs
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows.update(self._db.execute(
+                    'SELECT id, item FROM items WHERE id IN ({})'.format(
+                        ', '.join('?' * len(chunk))), chunk))
+
+        items = [json.loads(rows[id]) for id in ids]
+        if record is not None:
+            items = [record.from_dict(item) for item in items]
+        return items
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM terms')
+            self._db.execute('DELETE FROM items')
+            self._count = 0
+
+    def close(self):
+        if self._writer is not None:
+            self._pending.put(None)
+            self._writer.join()
+        with self._lock:
+            self._db.close()
+
+    def _set_site(self, site):
+        row = self._db.execute(
+            'SELECT value FROM info WHERE name = ?', ('site',)).fetchone()
+        if row and row[0] == site:
+            return
+        self._db.execute('DELETE FROM terms')
+        self._db.execute('DELETE FROM items')
+        self._db.execute('INSERT OR REPLACE INTO info VALUES (?, ?)',
+                         ('site', site))
+
+    def _prune(self, count):
+        # Least recently updated items go first
+        ids = [(id,) for id, in self._db.execute(
+            'SELECT id FROM items ORDER BY updated LIMIT ?', (count,))]
+        self._db.executemany('DELETE FROM terms WHERE item = ?', ids)
+        self._db.executemany('DELETE FROM items WHERE id = ?', ids)
+        self._count -= len(ids)
@@ -2,6 +2,12 @@
 from __future__ import unicode_literals, print_function
 
 import datetime as dt
+import email.utils
+import functools
+import re
+import unicodedata
+import uritools
+from lxml import etree
 
 from scrapper import Scrapper
 
@@ -24,7 +30,8 @@ API_URLS = {
     'URL_PROGRAM': 'podcast_sq_{}_1.html',
     'URL_CHANNEL': 'escuchar_nq_{}_1.html',
     'URL_AUDIO': 'listen_mn_{0}_1.mp3',
-    'XML_PROGRAM': '{1}_fg_{0}.xml',  # '{1}_fg_{0}_filtro_1.xml' to allow pagination
+    'XML_PROGRAM': '{1}_fg_{0}.xml',
+    'XML_PROGRAM_PAGE': '{1}_fg_{0}_filtro_{2}.xml',
     'LIST_INDEX': 'mis-listas_hk.html',
     'LIST_HOME': '',
     'LIST_PENDING': 'mis-audios_hn_{}.html',
@@ -33,6 +40,23 @@ API_URLS = {
 }
 
 
+# Regular expressions matching the relative urls of each API_URLS item
+_ENDPOINTS = [
+    (name, re.compile('^{}$'.format(
+        re.sub(r'\\\{\d*\\\}', '(.*)', re.escape(API_URLS[name])))))
+    for name in sorted(API_URLS)
+]
+
+# Memoized UrlContext of each base url, and feed of each program url
+_CONTEXTS = {}
+_FEEDS = {}
+MEMO_SIZE = 4096
+
+# API_URLS items only available to logged users
+USER_ENDPOINTS = ('SUBSCRIPTIONS', 'LIST_INDEX', 'LIST_PENDING',
+                  'LIST_FAVORITES', 'LIST_HISTORY')
+
+
 def get_baseurl(lang='ES', country='ES'):
     assert lang in LANGUAGES, \
         "Language not supported: '{}'".format(lang)
@@ -45,10 +69,48 @@ def get_baseurl(lang='ES', country='ES'):
     return 'http://{}.ivoox.com/{}'.format(prefix, suffix)
 
 
+class UrlContext(object):
+    """Base url of an iVoox site, and the absolute urls built on it.
+
+    Joining urls is slow, so each one is built only once.
+    """
+
+    def __init__(self, baseurl):
+        self.baseurl = baseurl
+        self._urls = {}
+
+    def absolute(self, relurl):
+        try:
+            return self._urls[relurl]
+        except KeyError:
+            if len(self._urls) >= MEMO_SIZE:
+                self._urls.clear()
+            url = self._urls[relurl] = uritools.urijoin(self.baseurl, relurl)
+            return url
+
+
+def get_url_context(lang='ES', country='ES'):
+    """Return the shared UrlContext of an iVoox site"""
+    baseurl = get_baseurl(lang=lang, country=country)
+    try:
+        return _CONTEXTS[baseurl]
+    except KeyError:
+        context = _CONTEXTS[baseurl] = UrlContext(baseurl)
+        return context
+
+
 def format_url(item, *args):
     return API_URLS[item].format(*args)
 
 
+def parse_endpoint(url):
+    """Return the API_URLS item a relative url was built from"""
+    for name, regex in _ENDPOINTS:
+        if regex.match(url):
+            return name
+    return None
+
+
 def get_scrapper(type, **options):
     if type == 'episodes':
         scrapper = IVooxEpisodes(**options)
@@ -60,6 +122,8 @@ def get_scrapper(type, **options):
         scrapper = IVooxCategories(**options)
     elif type in ('lists', 'channels'):
         scrapper = IVooxSimpleItems(**options)
+    elif type == 'login':
+        scrapper = CheckLogin(**options)
     else:
         raise KeyError('No scrapper for type %s', type)
 
@@ -71,18 +135,44 @@ def parse_url_code(url):
 
 
 def parse_feed_xml(info, feed_name='podcast'):
+    # Programs are listed over and over again
+    try:
+        return _FEEDS[info, feed_name]
+    except KeyError:
+        if len(_FEEDS) >= MEMO_SIZE:
+            _FEEDS.clear()
+        feed = _FEEDS[info, feed_name] = _parse_feed_xml(info, feed_name)
+        return feed
+
+
+def _parse_feed_xml(info, feed_name):
     if info.endswith('.xml'):
         return info
-    elif info.endswith('.html'):
-        code = parse_url_code(info)
-    else:
-        code = info
+    return format_url('XML_PROGRAM', parse_program_code(info), feed_name)
+
+
+def format_feed_page(xml, page=1):
+    """Relative url of a page of the paginated variant of a feed"""
+    match = re.match(dict(_ENDPOINTS)['XML_PROGRAM'], xml)
+    if not match:
+        raise ValueError('Not a program feed: {}'.format(xml))
+    feed_name, code = match.groups()
+    return format_url('XML_PROGRAM_PAGE', code, feed_name, page)
+
+
+def parse_feed_code(xml):
+    """Program code of a program feed, None if not one"""
+    match = re.match(dict(_ENDPOINTS)['XML_PROGRAM'], xml.rsplit('/', 1)[-1])
+    return match.group(2) if match else None
+
+
+def parse_program_code(info):
+    code = parse_url_code(info) if info.endswith('.html') else info
 
     # subscription urls lack the first part of the code
     if not code.startswith('f1'):
         code = 'f1{}'.format(code)
-
-    return format_url('XML_PROGRAM', code, feed_name)
+    return code
 
 
 def parse_duration(strtime):
@@ -90,56 +180,141 @@ def parse_duration(strtime):
                for i, x in enumerate(reversed(strtime.split(":"))))
 
 
-def parse_fuzzy_date(fuzzy_date):
+def parse_date(date, today=None):
+    """Turn a 'dd/mm/yyyy' (or fuzzy) date into the ISO format of Mopidy"""
+    if not date or not date.strip():
+        return None
+    try:
+        date_time = dt.datetime.strptime(date.strip(), '%d/%m/%Y')
+    except ValueError:
+        return parse_fuzzy_date(date, today=today)
+    return date_time.date().isoformat()
+
 
-    days_ago = lambda x: '{0:%d}-{0:%m}-{0:%Y}'.format(
-        dt.date.today() - dt.timedelta(x))
-    months_ago = lambda x: '{0:%m}-{0:%Y}'.format(
-        dt.date.today() - dt.timedelta(x * 30))
-    years_ago = lambda x: '{0:%Y}'.format(
-        dt.date.today() - dt.timedelta(x * 365))
-    parse_error = lambda x: x
+_ITUNES = '{http://www.itunes.com/dtds/podcast-1.0.dtd}'
 
-    if not fuzzy_date:
+
+def parse_feed_episodes(content, program, record):
+    """Episodes of a program feed page, as records of IVooxEpisodes"""
+    try:
+        channel = etree.fromstring(content).find('channel')
+    except etree.XMLSyntaxError:
+        return []
+    if channel is None:
+        return []
+    program_url = format_url('URL_PROGRAM', program)
+    episodes = []
+    for item in channel.iterfind('item'):
+        duration = item.findtext(_ITUNES + 'duration')
+        image = item.find(_ITUNES + 'image')
+        date = email.utils.parsedate(item.findtext('pubDate') or '')
+        episodes.append(record.from_dict({
+            'name': item.findtext('title'),
+            'url': item.findtext('link'),
+            'description': item.findtext('description'),
+            'image': image.get('href') if image is not None else None,
+            'duration': parse_duration(duration) if duration else None,
+            # As dated on the pages of iVoox
+            'date': '{2:02d}/{1:02d}/{0:04d}'.format(*date) if date else None,
+            'program': channel.findtext('title'),
+            'program_url': program_url,
+        }))
+    return episodes
+
+
+def normalize_text(text):
+    """Lowercase words of a text, without accents nor punctuation"""
+    if isinstance(text, bytes):
+        text = text.decode('ascii')
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ' '.join(''.join(char if char.isalnum() else ' '
+                            for char in text
+                            if not unicodedata.combining(char)).split())
+
+
+# Days ago meant by the fuzzy dates of every iVoox site language
+_FUZZY_WORDS = {
+    0: ('hoy', 'today', 'hoje', 'oggi', "aujourd'hui", 'heute'),
+    1: ('ayer', 'yesterday', 'ontem', 'ieri', 'hier', 'gestern'),
+    2: ('anteayer', 'antes de ayer', 'anteontem', 'antes de ontem',
+        "l'altro ieri", "l'altroieri", 'avant-hier', 'vorgestern'),
+}
+
+# Units of 'N units ago' fuzzy dates: (unit in days, ISO date format)
+_FUZZY_UNITS = [
+    ((0, '%Y-%m-%d'), ('minuto', 'minutos', 'minute', 'minutes', 'minuti',
+                       'minuten', 'hora', 'horas', 'hour', 'hours', 'ora',
+                       'ore', 'heure', 'heures', 'stunde', 'stunden')),
+    ((1, '%Y-%m-%d'), ('dia', 'dias', 'day', 'days', 'giorno', 'giorni',
+                       'jour', 'jours', 'tag', 'tage', 'tagen')),
+    ((7, '%Y-%m-%d'), ('semana', 'semanas', 'week', 'weeks', 'settimana',
+                       'settimane', 'semaine', 'semaines', 'woche',
+                       'wochen')),
+    ((30, '%Y-%m'), ('mes', 'meses', 'month', 'months', 'mese', 'mesi',
+                     'mois', 'monat', 'monate', 'monaten')),
+    ((365, '%Y'), ('ano', 'anos', 'year', 'years', 'anno', 'anni', 'an',
+                   'ans', 'annee', 'annees', 'jahr', 'jahre', 'jahren')),
+]
+
+# Words standing for 'one', as in 'hace un mes' or 'vor einem Jahr'
+_FUZZY_ONE = ('un', 'una', 'uno', 'um', 'uma', 'a', 'an', 'one', 'une',
+              'ein', 'eine', 'einem', 'einer')
+
+_FUZZY_DAYS = {normalize_text(word): days
+               for days, words in _FUZZY_WORDS.items() for word in words}
+_FUZZY_UNIT = {normalize_text(word): unit
+               for unit, words in _FUZZY_UNITS for word in words}
+_FUZZY_DATES = {}
+
+
+def parse_fuzzy_date(fuzzy_date, today=None):
+    """Turn an iVoox fuzzy date ('hace 3 días') into a sortable ISO date.
+
+    The date is as precise as the fuzzy one: 'YYYY-MM-DD' for days and
+    weeks, 'YYYY-MM' for months and 'YYYY' for years. Returns None when
+    the text is not understood.
+    """
+    if fuzzy_date is None:
         return None
+    today = today or dt.date.today()
+    try:
+        return _FUZZY_DATES[fuzzy_date, today]
+    except KeyError:
+        if len(_FUZZY_DATES) >= MEMO_SIZE:
+            _FUZZY_DATES.clear()
+        date = _FUZZY_DATES[fuzzy_date, today] = \
+            _parse_fuzzy_date(fuzzy_date, today)
+        return date
 
-    fuzzy_date = fuzzy_date.lower().strip()
-    parts = fuzzy_date.split()
 
-    # Known words
-    if fuzzy_date == 'hoy':
-        return days_ago(0)
-    elif fuzzy_date == 'ayer':
-        return days_ago(1)
+def _parse_subscription_date(fuzzy_date, today):
     # bug in ivoox page: returns '' for 2 days ago
-    elif fuzzy_date in ('anteayer', ''):
-        return days_ago(2)
-    elif len(parts) == 1:
-        # Only one unrecognized word
-        return parse_error(fuzzy_date)
+    if fuzzy_date is not None and not fuzzy_date.strip():
+        return (today - dt.timedelta(2)).isoformat()
+    return parse_fuzzy_date(fuzzy_date, today=today)
 
-    # More than 2 parts:Unknown format
-    if len(parts) > 2:
-        return parse_error(fuzzy_date)
 
-    # Format should be "N {día(s)|mes(es)|año(s)}
-    try:
-        date_number, date_word = parts
-        date_number = int(date_number)
-    except:
-        return parse_error(fuzzy_date)
+def _parse_fuzzy_date(fuzzy_date, today):
+    text = normalize_text(fuzzy_date)
 
-    if date_word in ('día', 'días', 'day', 'days'):
-        return days_ago(date_number)
-    if date_word in ('semana', 'semanas', 'week', 'weeks'):
-        return days_ago(date_number * 7)
-    elif date_word in ('mes', 'meses', 'month', 'months'):
-        return months_ago(date_number)
-    elif date_word in ('año', 'años', 'year', 'years'):
-        return years_ago(date_number)
-
-    # Got here -> Parsing error
-    return parse_error(fuzzy_date)
+    # Known words
+    days = _FUZZY_DAYS.get(text)
+    if days is not None:
+        return (today - dt.timedelta(days)).isoformat()
+
+    # 'N units', whatever words surround them ('hace', 'ago', 'vor'...)
+    number = None
+    for word in text.split():
+        if number is not None and word in _FUZZY_UNIT:
+            days, date_format = _FUZZY_UNIT[word]
+            return (today - dt.timedelta(number * days)).strftime(date_format)
+        if word.isdigit():
+            number = int(word)
+        elif word in _FUZZY_ONE:
+            number = 1
+        else:
+            number = None
+    return None
 
 
 class IVooxEpisodes(Scrapper):
@@ -159,6 +334,8 @@ class IVooxEpisodes(Scrapper):
         self.add_field('program_url', '//div[@class="wrapper"]/a/@href')
 
         self.add_field('guid', basefield='url', parser=parse_url_code)
+        self.add_field('program_code', basefield='program_url',
+                       parser=parse_url_code)
         self.add_field('xml', basefield = 'program_url',
                         parser=parse_feed_xml)
         self.add_field('mp3', basefield='guid',
@@ -182,15 +359,19 @@ class IVooxSubscriptions(Scrapper):
 
     def declare_fields(self):
         self.item_selector = './/tr'
+        # Fuzzy dates of a page are relative to the same day
+        today = dt.date.today()
 
         self.add_field('name', '//a[@class="title"]/text()')
         self.add_field('image', '//img[@class="photo hidden-xs"]/@src')
         self.add_field('date', '//span[@class="date"]/text()',
-                       parser=parse_fuzzy_date)
+                       parser=functools.partial(_parse_subscription_date,
+                                                today=today))
         self.add_field('new_audios', '//td[@class="td-sm"]/a[@class="circle-link"]/text()',
                        parser=int, default=0)
-        self.add_field('xml', '//a[@class="share"]/@href',
-                       parser=parse_feed_xml)
+        self.add_field('url', '//a[@class="share"]/@href')
+        self.add_field('code', basefield='url', parser=parse_program_code)
+        self.add_field('xml', basefield='url', parser=parse_feed_xml)
 
 
 class IVooxCategories(Scrapper):
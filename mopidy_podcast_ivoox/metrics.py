@@ -0,0 +1,129 @@
+from __future__ import unicode_literals
+
+import collections
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer(object):
+
+    def __init__(self, metrics, stage, key):
+        self._metrics = metrics
+        self._stage = stage
+        self._key = key
+
+    def __enter__(self):
+        self._start = self._metrics._clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._metrics.record(self._stage, self._key,
+                             self._metrics._clock() - self._start)
+        return False
+
+
+class Metrics(object):
+    """Thread-safe timings of each stage (fetch, parse...) by key.
+
+    Keys are API_URLS items for the stages of a request, and browse base
+    uris for the stages of a browse. While disabled, timers do nothing.
+    """
+
+    def __init__(self, enabled=False, clock=time.time):
+        self.enabled = enabled
+        self._clock = clock
+        self._lock = threading.Lock()
+        # [count, total seconds, max seconds] by (stage, key)
+        self._stages = collections.defaultdict(lambda: [0, 0.0, 0.0])
+        self._in_flight = collections.defaultdict(int)
+        self._logger = None
+        self._stopped = threading.Event()
+
+    def timer(self, stage, key):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage, key)
+
+    def record(self, stage, key, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            timing = self._stages[stage, key]
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+    def started(self, key):
+        if self.enabled:
+            with self._lock:
+                self._in_flight[key] += 1
+
+    def finished(self, key):
+        if self.enabled:
+            with self._lock:
+                self._in_flight[key] -= 1
+
+    def snapshot(self):
+        """Return the timings (ms) by stage and key, and requests in flight"""
+        with self._lock:
+            stages = {}
+            for (stage, key), (count, total, longest) in \
+                    self._stages.iteritems():
+                stages.setdefault(stage, {})[key] = {
+                    'count': count,
+                    'total_ms': round(1000 * total, 3),
+                    'mean_ms': round(1000 * total / count, 3),
+                    'max_ms': round(1000 * longest, 3),
+                }
+            in_flight = {key: count for key, count
+                         in self._in_flight.iteritems() if count}
+        return {'stages': stages, 'in_flight': in_flight}
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+    def summary(self):
+        lines = []
+        for stage, keys in sorted(self.snapshot()['stages'].items()):
+            for key, timing in sorted(keys.items()):
+                lines.append('{} {}: {count} x {mean_ms:.1f} ms '
+                             '(max {max_ms:.1f} ms)'.format(stage, key,
+                                                            **timing))
+        return '\n'.join(lines)
+
+    def start_logging(self, interval):
+        """Log a summary every `interval` seconds until stopped"""
+        if not (self.enabled and interval) or self._logger:
+            return
+        self._stopped.clear()
+        self._logger = threading.Thread(target=self._log_summaries,
+                                        args=(interval,),
+                                        name='IVooxMetrics')
+        self._logger.daemon = True
+        self._logger.start()
+
+    def stop_logging(self):
+        if self._logger:
+            self._stopped.set()
+            self._logger = None
+
+    def _log_summaries(self, interval):
+        while not self._stopped.wait(interval):
+            logger.info('iVoox timings:\n%s', self.summary())
@@ -0,0 +1,67 @@
+from __future__ import unicode_literals
+
+import logging
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+from cache import ResponseCache, SingleFlight
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds a resolved media url is used, as CDN locations may expire
+RESOLVED_TTL = 15 * 60
+
+
+class AudioResolver(object):
+    """Media locations of iVoox audio urls, resolved ahead of playback.
+
+    Audio urls are redirected one or more times before the media file.
+    Following those redirects in the background, while other episodes
+    play, saves them when playback starts. Resolved urls are kept for
+    `ttl` seconds.
+    """
+
+    def __init__(self, session=None, ttl=RESOLVED_TTL, timeout=(5, 15),
+                 maxsize=256, workers=2):
+        self._session = session or requests.session()
+        self._ttl = ttl
+        self._timeout = timeout
+        self._resolved = ResponseCache(maxsize=maxsize)
+        self._resolving = SingleFlight()
+        self._pool = ThreadPool(processes=workers)
+
+    def get(self, url):
+        """Return the resolved url if known, or url itself otherwise"""
+        return self._resolved.get(url, url)
+
+    def resolve(self, url):
+        """Follow the redirects of url, returning the media location"""
+        resolved = self._resolved.get(url)
+        if resolved is None:
+            resolved = self._resolving.do(url, self._resolve, url)
+        return resolved
+
+    def prefetch(self, urls):
+        """Resolve urls in the background"""
+        for url in urls:
+            self._pool.apply_async(self.resolve, (url,))
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+
+    def _resolve(self, url):
+        try:
+            response = self._session.head(url, allow_redirects=True,
+                                          timeout=self._timeout)
+            response.close()
+            response.raise_for_status()
+        except requests.RequestException as ex:
+            # Left to the player, which follows redirects anyway
+            logger.warning('Error resolving %s: %s', url, ex)
+            return url
+        logger.debug('Resolved %s to %s', url, response.url)
+        self._resolved.set(url, response.url, self._ttl)
+        return response.url
@@ -1,6 +1,172 @@
 import requests
 import collections
-from lxml import html
+import hashlib
+import itertools
+import re
+import time
+from lxml import etree, html
+
+
+_XPATHS = {}
+_MATCHERS = {}
+_RECORDS = {}
+
+
+def compile_xpath(expression):
+    """Return a compiled, reusable evaluator for an xpath expression"""
+    try:
+        return _XPATHS[expression]
+    except KeyError:
+        # Plain strings, instead of ones keeping their whole tree alive
+        evaluator = _XPATHS[expression] = etree.XPath(expression,
+                                                      smart_strings=False)
+        return evaluator
+
+
+def compile_matcher(selector):
+    """Turn a './/a//b' item selector into a test on the element itself.
+
+    Returns a (tag, evaluator) tuple, where evaluator is the compiled
+    'self::b[ancestor::a]' xpath, or None if the selector uses any other
+    axis and items can only be selected once the whole page is parsed.
+    """
+    try:
+        return _MATCHERS[selector]
+    except KeyError:
+        pass
+
+    steps, step, depth, quote = [], '', 0, None
+    for char in selector:
+        if quote:
+            quote = None if char == quote else quote
+        elif char in '\'"':
+            quote = char
+        elif char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+        elif char == '/' and not depth:
+            steps.append(step)
+            step = ''
+            continue
+        step += char
+    steps.append(step)
+
+    # Only descendant steps are supported: ['.', '', 'a', '', 'b']
+    names = steps[2::2]
+    if steps[0] != '.' or len(steps) < 3 or len(steps) % 2 == 0 \
+            or any(steps[1::2]) or not all(names):
+        matcher = None
+    else:
+        condition = ''
+        for name in names[:-1]:
+            condition = '[ancestor::{}{}]'.format(name, condition)
+        tag = re.match(r'[\w-]+|\*', names[-1]).group()
+        matcher = (None if tag == '*' else tag,
+                   compile_xpath('self::{}{}'.format(names[-1], condition)))
+
+    _MATCHERS[selector] = matcher
+    return matcher
+
+
+class Record(object):
+    """Compact scraped item, with a slot for each field.
+
+    Derived fields are computed from their base field on first access.
+    Fields can also be read as keys, like in a dict.
+    """
+    __slots__ = ()
+    _fields = ()
+    _names = frozenset()
+
+    def __init__(self, *values):
+        for name, value in zip(self._fields, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(*[data.get(name) for name in cls._fields])
+
+    def to_json(self):
+        """Dict of the scraped fields, as derived ones can be recomputed"""
+        return {name: getattr(self, name) for name in self._fields}
+
+    def _asdict(self):
+        return {name: getattr(self, name) for name in self._names}
+
+    def keys(self):
+        return list(self._names)
+
+    def __getitem__(self, name):
+        if name not in self._names:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def get(self, name, default=None):
+        return getattr(self, name) if name in self._names else default
+
+    def __eq__(self, other):
+        return type(self) is type(other) and \
+            self.to_json() == other.to_json()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, ', '.join(
+            '{}={!r}'.format(name, getattr(self, name))
+            for name in self._fields))
+
+
+class _Derived(object):
+
+    def __init__(self, slot, basefield, parser, default):
+        self._slot = slot
+        self._basefield = basefield
+        self._parser = parser
+        self._default = default
+
+    def __get__(self, record, owner):
+        if record is None:
+            return self
+        try:
+            return self._slot.__get__(record, owner)
+        except AttributeError:
+            try:
+                value = self._parser(getattr(record, self._basefield))
+            except (AttributeError, IndexError, TypeError, ValueError):
+                value = self._default
+            self._slot.__set__(record, value)
+            return value
+
+
+def record_class(name, fieldlist):
+    """Return the Record type of a scrapper declared fields"""
+    signature = (name,) + tuple(
+        (field_name, field.basefield)
+        for field_name, field in fieldlist.iteritems())
+    try:
+        return _RECORDS[signature]
+    except KeyError:
+        pass
+
+    fields = tuple(field_name for field_name, field in fieldlist.iteritems()
+                   if not field.basefield)
+    derived = [(field_name, field) for field_name, field
+               in fieldlist.iteritems() if field.basefield]
+    cls = type(str(name), (Record,), {
+        '__slots__': fields + tuple('_' + field_name
+                                    for field_name, _ in derived),
+        '_fields': fields,
+        '_names': frozenset(fieldlist),
+    })
+    for field_name, field in derived:
+        setattr(cls, field_name, _Derived(cls.__dict__['_' + field_name],
+                                          field.basefield, field.parser,
+                                          field.default))
+
+    _RECORDS[signature] = cls
+    return cls
 
 
 class Field(object):
@@ -8,6 +174,7 @@ class Field(object):
                  xpath=None, basefield=None,
                  parser=None, default=None):
         self.xpath = xpath
+        self.evaluate = compile_xpath('.' + xpath) if xpath else None
         self.value_list = []
         self.parser = parser or (lambda x: x)
         self.basefield = basefield
@@ -15,7 +182,7 @@ class Field(object):
 
     def extract(self, data):
         try:
-            raw_value = data.xpath('.' + self.xpath)[0]
+            raw_value = self.evaluate(data)[0]
             return self.parser(raw_value)
         except:
             return self.default
@@ -23,11 +190,26 @@ class Field(object):
 
 class Scrapper(object):
 
-    def __init__(self, session=None):
+    def __init__(self, session=None, timeout=None,
+                 stream=True, chunk_size=16 * 1024):
         self._session = session or requests.session()
+        self._timeout = timeout
+        self.response = None
+        self.digest = None
+        self.size = None
+        self.extract_time = None
+        self._chunk_size = chunk_size
         self._fieldlist = collections.OrderedDict()
         self.item_selector = '.'  # dot indicates root xpath
         self.declare_fields()
+        self.record = record_class(self.__class__.__name__ + 'Item',
+                                   self._fieldlist)
+        self._extractors = [field.extract
+                            for field in self._fieldlist.itervalues()
+                            if not field.basefield]
+        self._select_items = compile_xpath(self.item_selector)
+        self._match_item = compile_matcher(self.item_selector) \
+            if stream else None
 
     def declare_fields(self):
         pass
@@ -38,27 +220,92 @@ class Scrapper(object):
     def clear_fields(self):
         self._fieldlist.clear()
 
-    def scrap(self, url):
-        data = self._get_data_from_url(url)
-        items = data.xpath(self.item_selector)
-        itemlist = [self._populate_item(itemdata)
-                    for itemdata in items]
-        return itemlist
+    def scrap(self, url, max_items=None):
+        return list(self.iterscrap(url, max_items=max_items))
+
+    def iterscrap(self, url, max_items=None):
+        """Yield the scraped items of url as soon as each one is parsed"""
+        items = self.iterparse(self.fetch(url), max_items=max_items)
+        try:
+            for item in items:
+                yield item
+        finally:
+            items.close()
+
+    def fetch(self, url, headers=None):
+        """Request url, leaving the response body to be streamed"""
+        self.digest = self.size = None
+        self.response = self._session.get(
+            url, headers=headers, timeout=self._timeout, stream=True)
+        return self.response
+
+    def iterparse(self, response, max_items=None, digest=False):
+        """Yield the scraped items of a fetched response.
+
+        The body is hashed as it is parsed, and its SHA-1 is left in
+        `digest` and its length in `size` once it has been read. With
+        `digest`, the rest of the body is still read after `max_items`
+        items; otherwise the download stops there. If `extract_time` is
+        set to 0, the time spent extracting fields is added up on it.
+        """
+        chunks = self._iter_chunks(response)
+        if self._match_item:
+            items = self._iter_items(chunks, response.encoding)
+        else:
+            content = b''.join(chunks)
+            items = iter(self._select_items(html.document_fromstring(
+                content, parser=html.HTMLParser(encoding=response.encoding)))
+                if content else [])
+
+        try:
+            for itemdata in itertools.islice(items, max_items):
+                if self.extract_time is None:
+                    yield self._populate_item(itemdata)
+                    continue
+                start = time.time()
+                item = self._populate_item(itemdata)
+                self.extract_time += time.time() - start
+                yield item
+            if digest:
+                # Capped: the rest of the body is only hashed
+                for _ in chunks:
+                    pass
+        finally:
+            # Stops the download when leaving early
+            if hasattr(items, 'close'):
+                items.close()
+            response.close()
 
     def _populate_item(self, itemdata):
-        # Direct fields (xpath)
-        item = {name: field.extract(itemdata)
-                for name, field in self._fieldlist.iteritems()
-                if field.xpath}
-
-        # Relative fields (basefield)
-        for name, field in self._fieldlist.iteritems():
-            if field.basefield:
-                item.update({
-                    name: field.parser(item[field.basefield])
-                })
-
-        return item
-
-    def _get_data_from_url(self, url):
-        return html.fromstring(self._session.get(url).text)
+        # Relative fields (basefield) are only parsed when read
+        return self.record(*[extract(itemdata)
+                             for extract in self._extractors])
+
+    def _iter_chunks(self, response):
+        checksum, size = hashlib.sha1(), 0
+        for chunk in response.iter_content(self._chunk_size):
+            checksum.update(chunk)
+            size += len(chunk)
+            yield chunk
+        self.digest, self.size = checksum.hexdigest(), size
+
+    def _iter_items(self, chunks, encoding):
+        tag, is_item = self._match_item
+        parser = etree.HTMLPullParser(events=('end',), tag=tag,
+                                      encoding=encoding)
+        for chunk in itertools.chain(chunks, [None]):
+            if chunk is None:
+                # Nothing to flush (nor parse) on empty documents
+                if self.size:
+                    parser.close()
+            else:
+                parser.feed(chunk)
+
+            for _, element in parser.read_events():
+                if not is_item(element):
+                    continue
+                yield element
+                # Item already populated: free the parsed subtree
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
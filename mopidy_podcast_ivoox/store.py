@@ -0,0 +1,116 @@
+from __future__ import unicode_literals
+
+import collections
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+
+SCHEMA_VERSION = 3
+
+StoreEntry = collections.namedtuple(
+    'StoreEntry', ['items', 'fetched', 'etag', 'last_modified',
+                   'digest', 'size', 'parse_time'])
+
+
+class ScrapStore(object):
+    """Persistent storage of parsed scrap results, backed by sqlite.
+
+    Items are kept as zlib-compressed JSON, along with the time they were
+    fetched, the validators sent by the server and the SHA-1 digest, size
+    and parse time of the page they were scraped from. Only the results of
+    the most recently fetched `max_items` pages are kept.
+    """
+
+    def __init__(self, path=':memory:', max_items=10000):
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            version, = self._db.execute('PRAGMA user_version').fetchone()
+            if version != SCHEMA_VERSION:
+                # Just a cache: drop results stored by older versions
+                self._db.execute('DROP TABLE IF EXISTS scraps')
+                self._db.execute(
+                    'PRAGMA user_version = {:d}'.format(SCHEMA_VERSION))
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS scraps ('
+                ' key TEXT PRIMARY KEY,'
+                ' items BLOB NOT NULL,'
+                ' fetched REAL NOT NULL,'
+                ' etag TEXT,'
+                ' last_modified TEXT,'
+                ' digest TEXT,'
+                ' size INTEGER,'
+                ' parse_time REAL)')
+            self._db.execute(
+                'CREATE INDEX IF NOT EXISTS scraps_fetched'
+                ' ON scraps (fetched)')
+            self._count, = self._db.execute(
+                'SELECT COUNT(*) FROM scraps').fetchone()
+
+    def __len__(self):
+        return self._count
+
+    def get(self, key, record=None):
+        """Return the StoreEntry of key, with items of type `record`"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT items, fetched, etag, last_modified,'
+                ' digest, size, parse_time'
+                ' FROM scraps WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        items = json.loads(zlib.decompress(row[0]).decode('utf-8'))
+        if record is not None:
+            items = [record.from_dict(item) for item in items]
+        return StoreEntry(items, *row[1:])
+
+    def put(self, key, items, etag=None, last_modified=None,
+            digest=None, size=None, parse_time=None):
+        data = zlib.compress(json.dumps(items, default=_to_json)
+                             .encode('utf-8'))
+        with self._lock, self._db:
+            stored = self._db.execute(
+                'SELECT 1 FROM scraps WHERE key = ?', (key,)).fetchone()
+            self._db.execute(
+                'INSERT OR REPLACE INTO scraps'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, sqlite3.Binary(data), time.time(), etag, last_modified,
+                 digest, size, parse_time))
+            if not stored:
+                self._count += 1
+            if self._count > self.max_items:
+                self._prune(self._count - self.max_items)
+
+    def touch(self, key):
+        """Mark the stored results of key as fetched right now"""
+        with self._lock, self._db:
+            self._db.execute('UPDATE scraps SET fetched = ? WHERE key = ?',
+                             (time.time(), key))
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM scraps')
+            self._count = 0
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _prune(self, count):
+        # Least recently fetched (or revalidated) results go first
+        self._db.execute(
+            'DELETE FROM scraps WHERE key IN'
+            ' (SELECT key FROM scraps ORDER BY fetched LIMIT ?)', (count,))
+        self._count -= count
+
+
+def _to_json(item):
+    # Scraped records are stored as dicts of their fields
+    try:
+        return item.to_json()
+    except AttributeError:
+        raise TypeError('{!r} is not JSON serializable'.format(item))
@@ -0,0 +1,114 @@
+from __future__ import unicode_literals
+
+import json
+import logging
+import threading
+import time
+from functools import partial
+
+import ivooxapi
+
+
+logger = logging.getLogger(__name__)
+
+_NO_USER = object()
+
+
+class SubscriptionSync(object):
+    """Subscribed programs of the user, kept up to date incrementally.
+
+    The subscriptions page is polled at most every `interval` seconds.
+    Each poll is compared with the last known date and new audios of every
+    program, and only the episodes of programs that changed (and had been
+    loaded already) are fetched again. The last known state is kept in the
+    scrap store, so it survives restarts.
+    """
+
+    def __init__(self, client, interval=300, max_episodes=None):
+        self._client = client
+        self._interval = interval
+        self._max_episodes = max_episodes
+        self._lock = threading.Lock()
+        self._user = _NO_USER
+        self._programs = []
+        self._episodes = {}
+        self._polled = None
+
+    @property
+    def _key(self):
+        return json.dumps(['subscriptions', self._client.user])
+
+    def programs(self):
+        """Subscribed programs, most recently updated first"""
+        self._check_user()
+        if self._polled is None or \
+                time.time() - self._polled >= self._interval:
+            self.poll()
+        return self._programs
+
+    def episodes(self, code):
+        """Latest episodes of a subscribed program"""
+        episodes = self._episodes.get(code)
+        if episodes is None:
+            episodes = self._episodes[code] = \
+                self._client.get_program_episodes(
+                    code, max_items=self._max_episodes)
+        return episodes
+
+    def poll(self):
+        """Fetch the subscriptions page, returning the programs changed"""
+        self._check_user()
+        subscriptions = self._client.get_subscriptions()
+        previous = {program.code: program for program in self._programs}
+        changed = [program.code for program in subscriptions
+                   if _changed(previous.get(program.code), program)]
+
+        # Refresh the episodes of changed programs already browsed
+        reload = [code for code in changed if code in self._episodes]
+        for code in reload:
+            self._client.invalidate('get_program_episodes', code=code)
+        episodes = self._client.parallel(*[
+            partial(self._client.get_program_episodes, code,
+                    max_items=self._max_episodes)
+            for code in reload])
+
+        codes = set(program.code for program in subscriptions)
+        with self._lock:
+            self._programs = sorted(subscriptions,
+                                    key=lambda program: program.date or '',
+                                    reverse=True)
+            self._episodes = {code: items for code, items
+                              in self._episodes.iteritems() if code in codes}
+            self._episodes.update(zip(reload, episodes))
+            self._polled = time.time()
+
+        if changed:
+            logger.debug('Subscriptions changed: %s', ', '.join(changed))
+            self._client.store.put(self._key, self._programs)
+        return changed
+
+    def refresh(self, code=None):
+        """Poll on next access, reloading the episodes of `code`"""
+        self._client.invalidate('get_subscriptions')
+        self._polled = None
+        if code:
+            self._client.invalidate('get_program_episodes', code=code)
+            self._episodes.pop(code, None)
+
+    def _check_user(self):
+        # Start over, from the state stored for the user, on login changes
+        if self._user == self._client.user:
+            return
+        record = ivooxapi.IVooxSubscriptions(
+            session=self._client.session).record
+        entry = self._client.store.get(self._key, record=record)
+        with self._lock:
+            self._user = self._client.user
+            self._programs = entry.items if entry else []
+            self._episodes = {}
+            self._polled = None
+
+
+def _changed(known, program):
+    return known is None or \
+        (known.date, known.new_audios) != (program.date, program.new_audios)
@@ -0,0 +1,109 @@
+from __future__ import unicode_literals
+
+import Queue
+import logging
+import threading
+import time
+
+from mopidy.models import Ref
+
+
+logger = logging.getLogger(__name__)
+
+
+class CacheWarmer(object):
+    """Background walker filling the client cache before it is browsed.
+
+    Once login is done, and then every `interval` seconds (if any), the
+    warmer browses the directory tree from the root down to `depth` levels
+    (explore categories, user lists and their menus), pausing `delay`
+    seconds between pages to stay polite to iVoox. Next pages (and the
+    directories named as in `skip_names` that lead to them) are left to
+    be prefetched. Calls queued with prefetch() are run between those
+    pages, `delay` seconds apart too.
+    """
+
+    COLD, WARMING, WARM = 'cold', 'warming', 'warm'
+
+    def __init__(self, library, interval=0, depth=2, delay=1,
+                 skip_names=()):
+        self.state = self.COLD
+        self._library = library
+        self._interval = interval
+        self._depth = depth
+        self._delay = delay
+        self._skip_names = frozenset(skip_names)
+        self._queue = Queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='IVooxWarmer')
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._queue.put(None)
+
+    def prefetch(self, call):
+        self._queue.put(call)
+
+    def walk(self):
+        logger.debug('Warming up iVoox cache')
+        self.state = self.WARMING
+        start = time.time()
+
+        uris = [(self._library.root_directory.uri, 0)]
+        while uris and not self._stopped.is_set():
+            uri, level = uris.pop(0)
+            try:
+                refs = self._library.browse(uri)
+            except Exception as ex:
+                logger.warning('Error warming up %s: %s', uri, ex)
+                refs = []
+            if level < self._depth:
+                uris += [(ref.uri, level + 1) for ref in refs
+                         if self._walks(ref)]
+            self._pause()
+
+        if not self._stopped.is_set():
+            self.state = self.WARM
+            logger.info('iVoox cache warmed up in %.1f seconds',
+                        time.time() - start)
+
+    def _walks(self, ref):
+        return ref.type == Ref.DIRECTORY and \
+            ref.name not in self._skip_names and \
+            not ref.uri.rsplit(':', 1)[-1].startswith('page=')
+
+    def _pause(self):
+        # Rate limit, running a prefetch (if any is queued) between pages
+        self._stopped.wait(self._delay)
+        if not self._stopped.is_set() and self._run_queued(timeout=0):
+            self._stopped.wait(self._delay)
+
+    def _run_queued(self, timeout):
+        """Run the next queued call, returning whether there was any"""
+        try:
+            call = self._queue.get(block=timeout > 0, timeout=timeout)
+        except Queue.Empty:
+            return False
+        if call is None:
+            return False
+        try:
+            call()
+        except Exception as ex:
+            logger.warning('Error prefetching from iVoox: %s', ex)
+        return True
+
+    def _run(self):
+        self._library.login_done.wait()
+        next_walk = time.time()
+        while not self._stopped.is_set():
+            if next_walk is not None and time.time() >= next_walk:
+                self.walk()
+                next_walk = time.time() + self._interval \
+                    if self._interval else None
+            elif self._run_queued(
+                    timeout=next_walk - time.time() if next_walk else 60):
+                self._stopped.wait(self._delay)
@@ -0,0 +1,66 @@
+from __future__ import unicode_literals
+
+import logging
+
+import pykka
+import tornado.gen
+import tornado.web
+from concurrent.futures import ThreadPoolExecutor
+from tornado.concurrent import run_on_executor
+
+
+logger = logging.getLogger(__name__)
+
+
+def _get_backend():
+    from .backend import IVooxBackend
+
+    backends = pykka.ActorRegistry.get_by_class(IVooxBackend)
+    if not backends:
+        raise tornado.web.HTTPError(503, 'iVoox backend not running')
+    return backends[0].proxy()
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """Serve the metrics of the running iVoox backend as JSON"""
+
+    def get(self):
+        metrics = _get_backend().get_metrics().get(timeout=10)
+        if not metrics['enabled']:
+            raise tornado.web.HTTPError(404, 'iVoox metrics not enabled')
+        self.set_header('Cache-Control', 'no-cache')
+        self.write(metrics)
+
+
+class FeedHandler(tornado.web.RequestHandler):
+    """Serve complete iVoox program feeds from the backend feed cache"""
+
+    # iVoox is not waited on the Mopidy-HTTP event loop
+    executor = ThreadPoolExecutor(max_workers=4)
+
+    @tornado.gen.coroutine
+    def get(self, xml):
+        try:
+            feed = yield self._get_feed(xml)
+        except ValueError:
+            raise tornado.web.HTTPError(404, 'Not a program feed: %s', xml)
+        except Exception as ex:
+            logger.warning('Error loading iVoox feed %s: %s', xml, ex)
+            raise tornado.web.HTTPError(502)
+        if feed is None:
+            raise tornado.web.HTTPError(404)
+
+        self.set_header('Content-Type', 'application/rss+xml')
+        self.write(feed.content)
+
+    @run_on_executor
+    def _get_feed(self, xml):
+        feed_cache = _get_backend().feed_cache.get(timeout=10)
+        return feed_cache.get(xml)
+
+
+def http_factory(config, core):
+    return [
+        (r'/metrics/?', MetricsHandler),
+        (r'/feeds/([^/]+\.xml)', FeedHandler),
+    ]
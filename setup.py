@@ -28,7 +28,7 @@ setup(
         'Mopidy >= 1.0',
         'Mopidy-Podcast >= 2.0',
         'Pykka >= 1.1',
-        'requests >= 2.0'
+        'requests >= 2.4'
     ],
     entry_points={
         'mopidy.ext': [
@@ -0,0 +1,293 @@
+# -*- coding: utf8 -*-
+"""Offline benchmark of the iVoox scrappers.
+
+Every scrapper parses anonymised pages of 20 to 500 items, built from the
+markup of the real iVoox pages (see pages.py) and padded with the header,
+scripts and footer they carry. Reports items/sec, the cost of extracting
+each field, the memory kept by each scraped item and the peak memory used
+to parse a page, and compares them with the baselines stored in
+benchmark_baselines.json. Those are only meaningful on the machine they
+were recorded on, so record them again on a new one.
+
+    python -m tests.benchmark            # report and check the baselines
+    python -m tests.benchmark --save     # record new baselines
+"""
+from __future__ import unicode_literals, print_function, division
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from lxml import html
+
+from mopidy_podcast_ivoox import ivooxapi
+
+from . import pages
+
+
+SIZES = (20, 100, 500)
+
+BASELINES = os.path.join(os.path.dirname(__file__), 'benchmark_baselines.json')
+
+# Allowed slowdown (or memory growth) over the baselines, as a fraction
+TOLERANCE = 0.5
+
+FILLER = '''
+<header><nav class="navbar">{links}</nav></header>
+<script type="text/javascript">
+var config = {{"lang": "es", "ads": [{ads}]}};
+</script>
+<aside class="sidebar"><ul>{links}</ul></aside>
+'''
+
+LINK = '<li><a href="/seccion-{0}_sa_f4{0}_1.html" title="Secci\xf3n {0}">' \
+       'Secci\xf3n n\xfamero {0}</a></li>'
+
+
+def _padded(page):
+    filler = FILLER.format(
+        links=''.join(LINK.format(i) for i in range(40)),
+        ads=', '.join('"slot-{}"'.format(i) for i in range(40)))
+    body_start = page.index('<body>') + len('<body>')
+    return page[:body_start] + filler + page[body_start:] + filler
+
+
+def _home_page(count):
+    return pages.home_page(user='anonymous', count=count)
+
+
+# Scrapper class, scrapper options, page builder and max_items (as used
+# by the client) of each benchmark
+FIXTURES = {
+    'IVooxEpisodes': (ivooxapi.IVooxEpisodes, {}, pages.episodes_page, None),
+    'IVooxPrograms': (ivooxapi.IVooxPrograms, {}, pages.programs_page, None),
+    'IVooxSubscriptions': (ivooxapi.IVooxSubscriptions, {},
+                           pages.subscriptions_page, None),
+    'IVooxCategories': (ivooxapi.IVooxCategories, {'main': True},
+                        pages.categories_page, None),
+    'IVooxSimpleItems': (ivooxapi.IVooxSimpleItems, {},
+                         pages.channels_page, None),
+    'CheckLogin': (ivooxapi.CheckLogin, {}, _home_page, 1),
+}
+
+
+class FakeResponse(object):
+    """Just what Scrapper.iterparse reads from a requests response"""
+
+    encoding = 'utf-8'
+
+    def __init__(self, content):
+        self.content = content
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+def fixture(name, size):
+    return _padded(FIXTURES[name][2](size)).encode('utf-8')
+
+
+def _best_time(function, repeat, number=1):
+    """Best time of a call, out of `repeat` runs of `number` calls"""
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        for _ in range(number):
+            function()
+        elapsed = (time.time() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def field_costs(scrapper, content):
+    """Microseconds per item spent extracting each field"""
+    document = html.document_fromstring(content)
+    elements = scrapper._select_items(document)
+    items = [scrapper._populate_item(element) for element in elements]
+    costs = {}
+    for name, field in scrapper._fieldlist.iteritems():
+        if field.evaluate:
+            def run(field=field):
+                return [field.extract(element) for element in elements]
+        else:
+            def run(field=field):
+                return [field.parser(item[field.basefield])
+                        for item in items]
+        costs[name] = 1e6 * _best_time(run, 3) / max(len(elements), 1)
+    return costs
+
+
+def item_size(items):
+    """Mean bytes kept in memory by each item and its field values"""
+    if not items:
+        return 0
+    total = 0
+    for item in items:
+        values = item.to_json().values() if hasattr(item, 'to_json') \
+            else item.values()
+        total += sys.getsizeof(item) + sum(sys.getsizeof(value)
+                                           for value in values)
+    return total // len(items)
+
+
+def run_case(name, size, repeat=5):
+    """Benchmark one scrapper over a page of `size` items.
+
+    Peak memory is the growth of the peak resident size of the process,
+    so it is only meaningful on a new process, as run() does.
+    """
+    scrapper_class, options, _, max_items = FIXTURES[name]
+    content = fixture(name, size)
+    scrapper = scrapper_class(**options)
+    # Parsers and selectors are set up on first use, not on every page
+    list(scrapper.iterparse(FakeResponse(fixture(name, 1)), max_items))
+
+    # Peak memory of a single parse, before the garbage of timed ones
+    memory_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    parsed = list(scrapper.iterparse(FakeResponse(content), max_items))
+    peak_memory = resource.getrusage(
+        resource.RUSAGE_SELF).ru_maxrss - memory_before
+
+    # Small pages are parsed several times per run, to be timed reliably
+    results = [None]
+    elapsed = _best_time(lambda: results.__setitem__(
+        0, list(scrapper.iterparse(FakeResponse(content), max_items))),
+        repeat, number=max(1, 1000 // size))
+    items = len(results[0])
+
+    return {
+        'scrapper': name,
+        'size': size,
+        'items': items,
+        'bytes': len(content),
+        'seconds': elapsed,
+        'items_per_sec': items / elapsed if elapsed else 0,
+        'peak_memory_kb': peak_memory,
+        'item_bytes': item_size(parsed),
+        'field_us': field_costs(scrapper, content),
+    }
+
+
+def _run_isolated(name, size, repeat):
+    # A new interpreter, rather than a fork carrying the memory of this one
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'tests.benchmark', '--case', name, str(size),
+         '--repeat', str(repeat)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return json.loads(output)
+
+
+def run(names=None, sizes=SIZES, repeat=5):
+    """Run every case on a new process, so peak memory is its own"""
+    return [_run_isolated(name, size, repeat)
+            for name in sorted(names or FIXTURES) for size in sizes]
+
+
+def _key(result):
+    return '{}:{}'.format(result['scrapper'], result['size'])
+
+
+def load_baselines(path=BASELINES):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as baselines:
+        return json.load(baselines)
+
+
+def save_baselines(results, path=BASELINES):
+    baselines = {_key(result): {
+        'items_per_sec': round(result['items_per_sec'], 1),
+        'peak_memory_kb': result['peak_memory_kb'],
+        'item_bytes': result['item_bytes'],
+    } for result in results}
+    with open(path, 'w') as output:
+        json.dump(baselines, output, indent=2, sort_keys=True,
+                  separators=(',', ': '))
+        output.write('\n')
+
+
+def regressions(results, baselines, tolerance=TOLERANCE):
+    """Return a message for each result worse than its baseline"""
+    failures = []
+    for result in results:
+        baseline = baselines.get(_key(result))
+        if not baseline:
+            continue
+        minimum = baseline['items_per_sec'] * (1 - tolerance)
+        if result['items_per_sec'] < minimum:
+            failures.append('{}: {:.0f} items/sec, expected {:.0f}'.format(
+                _key(result), result['items_per_sec'], minimum))
+        # Few megabytes are just noise of the allocator
+        maximum = max(baseline['peak_memory_kb'] * (1 + tolerance), 1024)
+        if result['peak_memory_kb'] > maximum:
+            failures.append('{}: {} KB peak memory, expected {:.0f}'.format(
+                _key(result), result['peak_memory_kb'], maximum))
+        maximum = baseline.get('item_bytes', 0) * (1 + tolerance)
+        if maximum and result['item_bytes'] > maximum:
+            failures.append('{}: {} bytes per item, expected {:.0f}'.format(
+                _key(result), result['item_bytes'], maximum))
+    return failures
+
+
+def report(results):
+    lines = ['{:<20} {:>5} {:>9} {:>12} {:>10} {:>10}  {}'.format(
+        'scrapper', 'items', 'KB', 'items/sec', 'item bytes', 'peak KB',
+        'us/item by field')]
+    for result in results:
+        fields = ', '.join('{}={:.1f}'.format(name, cost) for name, cost
+                           in sorted(result['field_us'].items(),
+                                     key=lambda field: -field[1]))
+        lines.append(
+            '{:<20} {:>5} {:>9.1f} {:>12.0f} {:>10} {:>10}  {}'.format(
+                result['scrapper'], result['items'], result['bytes'] / 1024,
+                result['items_per_sec'], result['item_bytes'],
+                result['peak_memory_kb'], fields))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('scrappers', nargs='*',
+                        help='scrappers to benchmark (default: all), '
+                             'among: ' + ', '.join(sorted(FIXTURES)))
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--save', action='store_true',
+                        help='record the results as the new baselines')
+    parser.add_argument('--case', nargs=2, metavar=('SCRAPPER', 'SIZE'),
+                        help='run a single case, printing its result as JSON')
+    args = parser.parse_args(argv)
+
+    if args.case:
+        name, size = args.case
+        print(json.dumps(run_case(name, int(size), args.repeat)))
+        return 0
+    for name in args.scrappers:
+        if name not in FIXTURES:
+            parser.error('unknown scrapper: {}'.format(name))
+
+    results = run(args.scrappers, args.sizes, args.repeat)
+    print(report(results))
+
+    if args.save:
+        save_baselines(results)
+        print('Baselines saved to {}'.format(BASELINES))
+        return 0
+
+    failures = regressions(results, load_baselines(), args.tolerance)
+    for failure in failures:
+        print('REGRESSION ' + failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
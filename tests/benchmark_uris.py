@@ -0,0 +1,83 @@
+"""Micro-benchmark of turning scraped listings into Ref models.
+
+Compares the cost per item of building feed and episode uris on every
+call (as it was done before UrlContext) with the memoized builders of the
+library provider, over listings of 100 episodes and programs.
+
+    python -m tests.benchmark_uris
+"""
+from __future__ import unicode_literals, print_function, division
+
+import shutil
+import sys
+import tempfile
+import timeit
+
+import mock
+import uritools
+
+from mopidy_podcast_ivoox import backend, ivooxapi
+
+from . import benchmark, latency, pages
+from .fake_ivoox import FakeIVoox
+
+
+def _scrap(scrapper, page):
+    content = benchmark._padded(page).encode('utf-8')
+    return list(scrapper.iterparse(benchmark.FakeResponse(content)))
+
+
+def uncached_podcast_uri(xml):
+    return 'podcast+' + uritools.urijoin(ivooxapi.get_baseurl(), xml)
+
+
+def uncached_episode_uri(item):
+    program = ivooxapi.parse_url_code(item.program_url)
+    return backend.make_uri(backend.URI_EPISODE['uri'],
+                            '{}:{}'.format(program or '', item.guid))
+
+
+def run(number=200):
+    """Return the microseconds per item of each way of building uris"""
+    episodes = _scrap(ivooxapi.IVooxEpisodes(), pages.episodes_page(100))
+    programs = _scrap(ivooxapi.IVooxPrograms(), pages.programs_page(100))
+
+    data_dir = tempfile.mkdtemp()
+    try:
+        with FakeIVoox() as server, \
+                mock.patch('mopidy_podcast_ivoox.ivooxapi.get_baseurl',
+                           return_value=server.url):
+            library = backend.IVooxLibraryProvider(
+                latency.make_config(data_dir), backend=None)
+            library._startup.join()
+            library.ivoox.close()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    cases = [
+        ('feed uris, uncached', lambda: [
+            uncached_podcast_uri(ivooxapi._parse_feed_xml(item.url, 'podcast'))
+            for item in programs]),
+        ('feed uris, memoized', lambda: [
+            library._make_podcast_uri(ivooxapi.parse_feed_xml(item.url))
+            for item in programs]),
+        ('episode uris, uncached', lambda: [
+            uncached_episode_uri(item) for item in episodes]),
+        ('episode uris, memoized', lambda: [
+            library._make_episode_uri(item) for item in episodes]),
+        ('programs to refs', lambda: library._translate_programs(programs)),
+        ('episodes to refs', lambda: library._translate_episodes(episodes)),
+    ]
+    return [(name, 1e6 * min(timeit.repeat(case, number=number, repeat=3))
+             / number / 100)
+            for name, case in cases]
+
+
+def main():
+    for name, cost in run():
+        print('{:<25} {:>8.2f} us/item'.format(name, cost))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,202 @@
+from __future__ import unicode_literals
+
+import hashlib
+import random
+import re
+import threading
+import time
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler
+
+from mopidy_podcast_ivoox import ivooxapi
+
+from . import pages
+from .stub_server import _ThreadingServer
+
+
+SESSION_COOKIE = 'ivoox-session'
+
+
+class FakeIVoox(object):
+    """Local HTTP server answering every url pattern of ivooxapi.API_URLS.
+
+    Pages are generated from the request path, with `items` episodes or
+    programs each, so any listing (and its next pages) can be browsed.
+    Posting `user` and `password` to the login url sets a session cookie
+    and redirects to the home page, like iVoox does. User pages requested
+    without that cookie are redirected to the login page.
+
+    Every response waits `latency` seconds, plus a random `jitter`, and
+    fails with 503 Service Unavailable with probability `error_rate`.
+    Requests are recorded in `requests` as (method, path) tuples.
+    """
+
+    def __init__(self, latency=0, jitter=0, error_rate=0, items=20,
+                 user='someone', password='secret', seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.items = items
+        self.user = user
+        self.password = password
+        self.requests = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _ThreadingServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/'.format(self._server.server_port)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _delay_and_fate(self):
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+        return delay, failed
+
+    def render(self, path, logged):
+        """Return the HTML of a path, or None if there is no such page"""
+        endpoint = ivooxapi.parse_endpoint(path)
+        if endpoint is None:
+            return None
+        args = re.match(dict(ivooxapi._ENDPOINTS)[endpoint], path).groups()
+        navbar = pages.NAVBAR.format(self.user) if logged else ''
+
+        if endpoint == 'EXPLORE_EPISODES':
+            category, page = args
+            return navbar + _categories(category) + \
+                self._episodes(category, page)
+        if endpoint in ('EXPLORE_PROGRAMS', 'EXPLORE_CHANNELS',
+                        'URL_CHANNEL', 'SEARCH_PROGRAMS'):
+            return navbar + self._programs(*args)
+        if endpoint in ('EXPLORE_LISTS', 'SEARCH_EPISODES'):
+            return navbar + self._episodes(*args)
+        if endpoint in ('LIST_PENDING', 'LIST_FAVORITES', 'LIST_HISTORY'):
+            return navbar + self._episodes(endpoint, args[0])
+        if endpoint == 'URL_PROGRAM':
+            return navbar + self._episodes(*args)
+        if endpoint == 'SEARCH_CHANNELS':
+            return navbar + _body(pages.channels_page(self.items))
+        if endpoint == 'LIST_INDEX':
+            # First two items are the built-in lists
+            return navbar + _body(pages.channels_page(5))
+        if endpoint == 'SUBSCRIPTIONS':
+            return navbar + _body(pages.subscriptions_page(self.items))
+        if endpoint == 'LIST_HOME':
+            return navbar + self._episodes('home', '1')
+        if endpoint == 'LOGIN':
+            return ''
+        return None
+
+    def _episodes(self, listing, page='1'):
+        return _body(pages.episodes_page(
+            self.items, program=_number(listing, page)))
+
+    def _programs(self, listing, page='1'):
+        return _body(pages.programs_page(self.items))
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Whole responses in a single packet, or the delayed ACKs of
+            # the client would dominate the latency
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                self._respond('GET')
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                form = urlparse.parse_qs(self.rfile.read(length))
+                self._respond('POST', form)
+
+            def _respond(self, method, form=None):
+                with fake._lock:
+                    fake.requests.append((method, self.path))
+                delay, failed = fake._delay_and_fate()
+                time.sleep(delay)
+                if failed:
+                    return self._send(503, b'')
+
+                path = self.path.lstrip('/')
+                endpoint = ivooxapi.parse_endpoint(path)
+                logged = SESSION_COOKIE in self.headers.get('Cookie', '')
+
+                if method == 'POST' and endpoint == 'LOGIN':
+                    if form.get('at-user') == [fake.user] and \
+                            form.get('at-pw') == [fake.password]:
+                        return self._send(302, b'', {
+                            'Location': fake.url,
+                            'Set-Cookie': '{}=1; Path=/'.format(
+                                SESSION_COOKIE)})
+                    return self._send(302, b'', {'Location': fake.url})
+
+                if endpoint in ivooxapi.USER_ENDPOINTS and not logged:
+                    return self._send(302, b'', {
+                        'Location': fake.url + ivooxapi.format_url('LOGIN')})
+
+                body = fake.render(path, logged)
+                if body is None:
+                    return self._send(404, b'')
+
+                body = pages.PAGE.format(body).encode('utf-8')
+                etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+                if self.headers.get('If-None-Match') == etag:
+                    return self._send(304, b'')
+                self._send(200, body, {'ETag': etag})
+
+            def _send(self, status, body, headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _body(page):
+    return page[page.index('<body>') + 6:page.rindex('</body>')]
+
+
+def _categories(category):
+    if category == 'f':
+        # Main genres
+        return '<div class="pills-container"><ul>{}</ul></div>'.format(
+            ''.join(pages.CATEGORY.format(i) for i in range(10)))
+    if category.startswith('f4'):
+        # Subgenres are not listed
+        return ''
+    return '<ul class="nav nav-pills">{}</ul>'.format(''.join(
+        '<li><a title="Subcategory {0}" href="audios_sa_f4{0}_1.html">'
+        '</a></li>'.format(i) for i in range(5)))
+
+
+def _number(*parts):
+    """Stable program number for a listing, so pages differ"""
+    digest = hashlib.md5(':'.join(parts).encode('utf-8')).hexdigest()
+    return 100 + int(digest[:6], 16) % 900
@@ -0,0 +1,223 @@
+"""End to end latency of the library provider against a fake iVoox.
+
+Each run starts a new IVooxLibraryProvider, with empty caches, and plays
+a scripted session of browse, refresh and search steps on it. Reports the
+p50/p95/p99 latency and the mean number of requests to iVoox of each step.
+
+    python -m tests.latency --runs 20 --latency 0.1 --jitter 0.05
+"""
+from __future__ import unicode_literals, print_function, division
+
+import argparse
+import collections
+import logging
+import math
+import shutil
+import sys
+import tempfile
+import time
+
+import mock
+
+from mopidy_podcast_ivoox import backend
+
+from .fake_ivoox import FakeIVoox
+
+
+# Steps of each session: ('login',), ('browse', uri), ('refresh', uri)
+# or ('search', query)
+SESSIONS = {
+    'anonymous': [
+        ('login',),
+        ('browse', 'podcast+ivoox:'),
+        ('browse', 'podcast+ivoox:explore:f40'),
+        ('browse', 'podcast+ivoox:explore:f40:page=2'),
+        ('browse', 'podcast+ivoox:explore:f40'),
+        ('refresh', 'podcast+ivoox:explore:f40'),
+        ('browse', 'podcast+ivoox:explore:f40'),
+        ('search', 'ciencia'),
+    ],
+    'logged': [
+        ('login',),
+        ('browse', 'podcast+ivoox:'),
+        ('browse', 'podcast+ivoox:list'),
+        ('browse', 'podcast+ivoox:list:favorites'),
+        ('browse', 'podcast+ivoox:explore'),
+        ('browse', 'podcast+ivoox:explore:f41'),
+        ('refresh', 'podcast+ivoox:'),
+        ('browse', 'podcast+ivoox:'),
+    ],
+}
+
+
+def make_config(cache_dir, **settings):
+    config = {
+        'username': '',
+        'password': '',
+        'lang': 'ES',
+        'country': 'ES',
+        'max_episodes': 20,
+        'max_programs': 20,
+        'workers': 4,
+        'cache_size': 256,
+        'pool_size': 10,
+        'connect_timeout': 5,
+        'read_timeout': 15,
+        'retries': 3,
+        'persistent_cache': False,
+        'warm_cache': False,
+        'warm_interval': 0,
+        'warm_depth': 2,
+        'warm_delay': 0,
+        'metrics': False,
+        'metrics_interval': 0,
+        'feed_proxy': False,
+        'prefetch_tracks': 0,
+        'latency_budget': 0,
+        'error_budget': 5,
+        'breaker_cooldown': 60,
+    }
+    config.update(settings)
+    return {'core': {'cache_dir': cache_dir, 'data_dir': cache_dir},
+            'podcast-ivoox': config}
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a list of values"""
+    ordered = sorted(values)
+    rank = int(math.ceil(percent * len(ordered) / 100)) - 1
+    return ordered[max(0, rank)]
+
+
+def _label(index, step):
+    return '{:d}. {}'.format(index + 1, ' '.join(step))
+
+
+def play(server, config, session):
+    """Play a session once, returning (label, seconds, requests, error)"""
+    timings = []
+    with mock.patch('mopidy_podcast_ivoox.ivooxapi.get_baseurl',
+                    return_value=server.url):
+        del server.requests[:]
+        start = time.time()
+        library = backend.IVooxLibraryProvider(config, backend=None)
+        try:
+            for index, step in enumerate(session):
+                requests = len(server.requests)
+                error = None
+                try:
+                    _run_step(library, step)
+                except Exception as ex:
+                    error = ex
+                elapsed = time.time() - start
+                timings.append((_label(index, step), elapsed,
+                                len(server.requests) - requests, error))
+                start = time.time()
+        finally:
+            library._startup.join()
+            if library.warmer:
+                library.warmer.stop()
+            library.ivoox.close()
+    return timings
+
+
+def _run_step(library, step):
+    action = step[0]
+    if action == 'login':
+        # Timed since the provider was created, along with the warm-up of
+        # the root directory that follows, so they do not overlap the steps
+        library._startup.join()
+    elif action == 'browse':
+        library.browse(step[1])
+    elif action == 'refresh':
+        library.refresh(step[1])
+    elif action == 'search':
+        library.search({'any': [step[1]]})
+    else:
+        raise ValueError('Unknown step: {}'.format(action))
+
+
+def run(session='anonymous', runs=10, latency=0.05, jitter=0, error_rate=0,
+        items=20, seed=None, **settings):
+    """Return the timings of every step along the runs, by step label"""
+    if session == 'logged':
+        settings.setdefault('username', 'someone')
+        settings.setdefault('password', 'secret')
+
+    results = collections.OrderedDict()
+    cache_dir = tempfile.mkdtemp()
+    server = FakeIVoox(latency=latency, jitter=jitter, error_rate=error_rate,
+                       items=items, seed=seed)
+    try:
+        with server:
+            for _ in range(runs):
+                # Nothing is kept from previous runs, not even the index
+                config = make_config(tempfile.mkdtemp(dir=cache_dir),
+                                     **settings)
+                for label, elapsed, requests, error in \
+                        play(server, config, SESSIONS[session]):
+                    step = results.setdefault(label, {
+                        'seconds': [], 'requests': [], 'errors': 0})
+                    step['seconds'].append(elapsed)
+                    step['requests'].append(requests)
+                    step['errors'] += 1 if error else 0
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return results
+
+
+def summary(results):
+    """p50/p95/p99 latency (ms) and mean requests of each step"""
+    return collections.OrderedDict(
+        (label, {
+            'p50': 1000 * percentile(step['seconds'], 50),
+            'p95': 1000 * percentile(step['seconds'], 95),
+            'p99': 1000 * percentile(step['seconds'], 99),
+            'requests': sum(step['requests']) / len(step['requests']),
+            'errors': step['errors'],
+        }) for label, step in results.items())
+
+
+def report(results):
+    lines = ['{:<45} {:>8} {:>8} {:>8} {:>9} {:>6}'.format(
+        'step', 'p50 ms', 'p95 ms', 'p99 ms', 'requests', 'errors')]
+    for label, step in summary(results).items():
+        lines.append(
+            '{:<45} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f} '
+            '{requests:>9.1f} {errors:>6}'.format(label, **step))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--session', choices=sorted(SESSIONS),
+                        default='anonymous')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='seconds taken by every fake iVoox response')
+    parser.add_argument('--jitter', type=float, default=0,
+                        help='random seconds added to the latency')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='fraction of responses failing with 503')
+    parser.add_argument('--items', type=int, default=20,
+                        help='episodes or programs on every page')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--latency-budget', type=int, default=0,
+                        help='milliseconds waited for the fake iVoox before '
+                             'serving stored results')
+    parser.add_argument('--warm', action='store_true',
+                        help='enable the cache warmer (its requests are '
+                             'counted on the steps they overlap)')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    results = run(args.session, runs=args.runs, latency=args.latency,
+                  jitter=args.jitter, error_rate=args.error_rate,
+                  items=args.items, seed=args.seed, warm_cache=args.warm,
+                  latency_budget=args.latency_budget)
+    print(report(results))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
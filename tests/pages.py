@@ -0,0 +1,108 @@
+# -*- coding: utf8 -*-
+"""HTML builders mimicking the iVoox pages parsed by the scrappers."""
+from __future__ import unicode_literals
+
+PAGE = '<html><head><meta charset="utf-8"/></head><body>{}</body></html>'
+
+EPISODE = '''
+<div itemprop="episode">
+  <meta itemprop="name" content="Episode {0}"/>
+  <meta itemprop="url"
+        content="http://www.ivoox.com/episode-{0}-audios-mp3_rf_{0}_1.html"/>
+  <meta itemprop="description" content="Description of episode {0}"/>
+  <img class="main" src="http://static.ivoox.com/episode-{0}.jpg"/>
+  <p class="time">{1:02d}:{2:02d}</p>
+  <ul><li class="date" title="18/10/2026"></li></ul>
+  <a class="rounded-label" title="Ciencia"></a>
+  <div class="wrapper">
+    <a title="Program {3}"
+       href="http://www.ivoox.com/podcast-program-{3}_sq_f1{3}_1.html"></a>
+  </div>
+</div>'''
+
+PROGRAM = '''
+<div itemtype="http://schema.org/RadioSeries">
+  <meta itemprop="name" content="Program {0}"/>
+  <meta itemprop="url"
+        content="http://www.ivoox.com/podcast-program-{0}_sq_f1{0}_1.html"/>
+  <meta itemprop="description" content="Description of program {0}"/>
+  <img class="main" src="http://static.ivoox.com/program-{0}.jpg"/>
+  <ul><li class="microphone"><a>{1}</a></li></ul>
+</div>'''
+
+CATEGORY = ('<li><a title="Category {0}" href="audios_sa_f4{0}_1.html">'
+            '</a></li>')
+
+NAVBAR = '''
+<div id="main-navbar">
+  <a class="hidden-xs user dropdown-toggle text-ellipsis"><span>{}</span></a>
+</div>'''
+
+SUBSCRIPTION = '''
+<tr>
+  <td><img class="photo hidden-xs"
+           src="http://static.ivoox.com/program-{0}.jpg"/></td>
+  <td><a class="title">Program {0}</a><span class="date">{2}</span></td>
+  <td class="td-sm"><a class="circle-link">{1}</a></td>
+  <td><a class="share"
+         href="http://www.ivoox.com/podcast-program-{0}_sq_f1{0}_1.html"></a>
+  </td>
+</tr>'''
+
+
+def episodes_page(count, program=100):
+    return PAGE.format(''.join(
+        EPISODE.format(1000 + i, i % 60, i % 60, program)
+        for i in range(count)))
+
+
+def programs_page(count):
+    return PAGE.format(''.join(
+        PROGRAM.format(100 + i, i) for i in range(count)))
+
+
+def categories_page(count, user=None):
+    return PAGE.format((NAVBAR.format(user) if user else '') +
+                       '<div class="pills-container"><ul>{}</ul></div>'.format(
+        ''.join(CATEGORY.format(i) for i in range(count))))
+
+
+def home_page(user=None, count=20):
+    return PAGE.format((NAVBAR.format(user) if user else '') +
+                       episodes_page(count))
+
+
+def subscriptions_page(count):
+    return PAGE.format('<table>{}</table>'.format(''.join(
+        SUBSCRIPTION.format(100 + i, i, 'hoy') for i in range(count))))
+
+
+CHANNEL = '''
+<div class="flip-container"><div class="content">
+  <a title="Channel {0}"
+     href="http://www.ivoox.com/escuchar_nq_c{0}_1.html"></a>
+</div></div>'''
+
+
+def channels_page(count):
+    return PAGE.format(''.join(CHANNEL.format(i) for i in range(count)))
+
+
+FEED = ('<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">'
+        '<channel><title>Program {0}</title>{1}</channel></rss>')
+
+FEED_ITEM = '''
+<item>
+  <title>Episode {0}</title>
+  <link>http://www.ivoox.com/episode-{0}-audios-mp3_rf_{0}_1.html</link>
+  <description>Description of episode {0}</description>
+  <pubDate>Sun, 18 Oct 2026 10:00:00 +0200</pubDate>
+  <itunes:duration>{1:02d}:{2:02d}</itunes:duration>
+  <itunes:image href="http://static.ivoox.com/episode-{0}.jpg"/>
+</item>'''
+
+
+def feed_page(guids, program=100):
+    return FEED.format(program, ''.join(
+        FEED_ITEM.format(guid, guid % 60, guid % 60) for guid in guids))
@@ -0,0 +1,113 @@
+from __future__ import unicode_literals
+
+import hashlib
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients closing kept-alive or streamed connections early
+        pass
+
+
+class StubServer(object):
+    """Local HTTP server serving canned pages after an injected delay.
+
+    `pages` maps request paths (without the leading slash) to HTML text.
+    `redirects` (and `post_redirects`, for POST requests) map request
+    paths to the paths they are redirected to.
+    With `etags` enabled, pages are sent with an ETag and conditional
+    requests for unchanged pages are answered with 304 Not Modified.
+    Every request is recorded in `requests` as a (method, path) tuple, and
+    the client address of each connection in `connections`.
+    """
+
+    def __init__(self, pages=None, delay=0, etags=False,
+                 redirects=None, post_redirects=None):
+        self.pages = pages or {}
+        self.redirects = redirects or {}
+        self.post_redirects = post_redirects or {}
+        self.delay = delay
+        self.etags = etags
+        self.requests = []
+        self.connections = set()
+        self._server = _ThreadingServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/'.format(self._server.server_port)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self._respond('GET', stub.redirects)
+
+            def do_HEAD(self):
+                self._respond('HEAD', stub.redirects)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                self.rfile.read(length)
+                self._respond('POST', stub.post_redirects)
+
+            def _respond(self, method, redirects):
+                stub.requests.append((method, self.path))
+                stub.connections.add(self.client_address)
+                time.sleep(stub.delay)
+                location = redirects.get(self.path.lstrip('/'))
+                if location is not None:
+                    self.send_response(302)
+                    self.send_header('Location', stub.url + location)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                body = stub.pages.get(self.path.lstrip('/'))
+                status = 200 if body is not None else 404
+                body = (body or '').encode('utf-8')
+                etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+                if stub.etags and \
+                        self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                self.send_response(status)
+                if stub.etags:
+                    self.send_header('ETag', etag)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if method != 'HEAD':
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
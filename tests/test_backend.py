@@ -0,0 +1,411 @@
+from __future__ import unicode_literals
+
+import time
+
+import mock
+import pytest
+from mopidy import models
+
+from mopidy_podcast_ivoox import backend
+
+from . import pages
+from .stub_server import StubServer
+
+
+@pytest.fixture
+def config(tmpdir):
+    return {
+        'core': {'cache_dir': str(tmpdir), 'data_dir': str(tmpdir)},
+        'podcast-ivoox': {
+            'username': '',
+            'password': '',
+            'lang': 'ES',
+            'country': 'ES',
+            'max_episodes': 20,
+            'max_programs': 20,
+            'workers': 4,
+            'cache_size': 256,
+            'pool_size': 10,
+            'connect_timeout': 5,
+            'read_timeout': 5,
+            'retries': 0,
+            'persistent_cache': False,
+            'warm_cache': False,
+            'warm_interval': 0,
+            'warm_depth': 2,
+            'warm_delay': 0,
+            'metrics': False,
+            'metrics_interval': 0,
+            'feed_proxy': False,
+            'prefetch_tracks': 0,
+            'latency_budget': 0,
+            'error_budget': 5,
+            'breaker_cooldown': 60,
+        }
+    }
+
+
+@pytest.fixture
+def server():
+    stub = StubServer(pages={
+        'audios_sa_f_1.html': pages.categories_page(5),
+        'podcasts_sc_f_1.html': pages.programs_page(5),
+        'some-query_sb_1.html': pages.episodes_page(3),
+        'some-query_sw_1_1.html': pages.programs_page(2),
+        'some-query_sw_2_1.html': pages.channels_page(1),
+    })
+    with stub:
+        yield stub
+
+
+@pytest.fixture
+def library(config, server):
+    with mock.patch('mopidy_podcast_ivoox.ivooxapi.get_baseurl',
+                    return_value=server.url):
+        provider = backend.IVooxLibraryProvider(config, backend=None)
+        provider._startup.join()
+        del server.requests[:]
+        yield provider
+        provider.ivoox.close()
+
+
+def test_program_albums_open_their_stored_feeds(config, server):
+    config['podcast-ivoox']['feed_proxy'] = True
+    server.pages['podcast_fg_f1100_filtro_1.xml'] = \
+        pages.feed_page([1001, 1000])
+
+    with mock.patch('mopidy_podcast_ivoox.ivooxapi.get_baseurl',
+                    return_value=server.url):
+        library = backend.IVooxLibraryProvider(config, backend=None)
+        library._startup.join()
+        refs = library.browse('podcast+ivoox:explore')
+        albums = [ref.uri for ref in refs if ref.type == models.Ref.ALBUM]
+        episodes = library.browse(albums[0])
+        del server.requests[:]
+        tracks = library.lookup(albums[0])
+        library.ivoox.close()
+
+    # Not bound to the Mopidy-HTTP address, nor going through it
+    assert albums[0] == 'podcast+ivoox:program:f1100'
+    assert episodes == [
+        models.Ref.track(name='Episode 1001',
+                         uri='podcast+ivoox:episode:f1100:1001'),
+        models.Ref.track(name='Episode 1000',
+                         uri='podcast+ivoox:episode:f1100:1000')]
+    assert [track.uri for track in tracks] == [ref.uri for ref in episodes]
+    assert server.requests == []
+
+
+def test_search_returns_episodes_programs_and_channels(library):
+    result = library.search({'any': ['Some  Query']})
+
+    assert result.uri == 'podcast+ivoox:search'
+    assert [track.name for track in result.tracks] == \
+        ['Episode 1000', 'Episode 1001', 'Episode 1002']
+    assert result.tracks[1].length == 61000
+    assert result.tracks[1].album.name == 'Program 100'
+    assert [album.name for album in result.albums] == \
+        ['Program 100', 'Program 101']
+    assert result.albums[0].uri.startswith('podcast+http://')
+    assert result.artists == (
+        models.Artist(name='Channel 0', uri='podcast+ivoox:channel:c0'),)
+
+
+def test_search_results_are_cached(library, server):
+    library.search({'any': ['some query']})
+    del server.requests[:]
+
+    library.search({'any': ['  SOME query ']})
+
+    assert server.requests == []
+
+
+def test_search_answers_from_browsed_items(library, server):
+    library.browse('podcast+ivoox:explore')
+    library.ivoox.index.flush()
+    del server.requests[:]
+
+    result = library.search({'any': ['description progra']})
+
+    assert [album.name for album in result.albums] == [
+        'Program 100', 'Program 101', 'Program 102', 'Program 103',
+        'Program 104']
+    # Only episodes and channels are asked to iVoox
+    assert sorted(path for _, path in server.requests) == [
+        '/description-progra_sb_1.html', '/description-progra_sw_2_1.html']
+
+
+def test_search_merges_local_and_remote_results(library, server):
+    library.search({'any': ['some query']})
+    library.ivoox.index.flush()
+    server.pages['episode_sb_1.html'] = pages.episodes_page(5, 200)
+
+    result = library.search({'any': ['episode']})
+
+    # Episodes found before first, then the ones only iVoox knows
+    assert [track.uri for track in result.tracks] == [
+        'podcast+ivoox:episode:f1100:1000',
+        'podcast+ivoox:episode:f1100:1001',
+        'podcast+ivoox:episode:f1100:1002',
+        'podcast+ivoox:episode:f1200:1003',
+        'podcast+ivoox:episode:f1200:1004']
+
+
+def test_search_fields_choose_the_types_searched(library, server):
+    result = library.search({'album': ['some query']})
+
+    assert [album.name for album in result.albums] == \
+        ['Program 100', 'Program 101']
+    assert result.tracks == result.artists == ()
+    assert server.requests == [('GET', '/some-query_sw_1_1.html')]
+
+
+def test_exact_search_only_returns_items_named_as_searched(library, server):
+    server.pages['program-101_sw_1_1.html'] = pages.programs_page(2)
+
+    result = library.search({'album': ['program 101']})
+    exact = library.search({'album': ['program 101']}, exact=True)
+
+    assert len(result.albums) == 2
+    assert [album.name for album in exact.albums] == ['Program 101']
+
+
+def test_search_ignores_other_uri_schemes(library):
+    assert library.search({'any': ['some query']}, uris=['file:']) is None
+
+
+@pytest.fixture
+def slow_server():
+    stub = StubServer(pages={
+        'ajx-login_zl.html': pages.PAGE.format(''),
+        '': pages.home_page(user='someone'),
+        'audios_sa_f_1.html': pages.categories_page(5),
+        'audios_sa_f40_1.html': pages.episodes_page(1),
+        'gestionar-suscripciones_je_1.html?order=date':
+            pages.subscriptions_page(3),
+    }, post_redirects={'ajx-login_zl.html': ''}, delay=0.5)
+    with stub:
+        yield stub
+
+
+def test_startup_does_not_wait_for_login(config, slow_server):
+    config['podcast-ivoox'].update(username='someone', password='secret')
+
+    with mock.patch('mopidy_podcast_ivoox.ivooxapi.get_baseurl',
+                    return_value=slow_server.url):
+        start = time.time()
+        library = backend.IVooxLibraryProvider(config, backend=None)
+        elapsed = time.time() - start
+
+        assert elapsed < slow_server.delay
+        assert not library.login_done.is_set()
+
+        # Anonymous explore menu until logged in
+        refs = library.browse('podcast+ivoox:')
+        assert refs[0] == models.Ref.directory(
+            name='Category 0', uri='podcast+ivoox:explore:f40')
+
+        assert library.login_done.wait(10 * slow_server.delay)
+        refs = library.browse('podcast+ivoox:')
+        library.ivoox.close()
+
+    assert ('POST', '/ajx-login_zl.html') in slow_server.requests
+    assert [ref.name for ref in refs] == [
+        'Explorar', 'Subscripciones', 'Listas',
+        'Program 100', 'Program 101 (1)', 'Program 102 (2)']
+
+
+def test_browse_subscriptions_lists_program_episodes(config, slow_server):
+    config['podcast-ivoox'].update(username='someone', password='secret',
+                                   max_programs=2)
+    slow_server.pages['podcast_sq_f1101_1.html'] = pages.episodes_page(2, 101)
+
+    with mock.patch('mopidy_podcast_ivoox.ivooxapi.get_baseurl',
+                    return_value=slow_server.url):
+        library = backend.IVooxLibraryProvider(config, backend=None)
+        library._startup.join()
+        programs = library.browse('podcast+ivoox:subs')
+        more = library.browse('podcast+ivoox:subs:page=2')
+        episodes = library.browse('podcast+ivoox:subs:f1101')
+        library.ivoox.close()
+
+    assert programs == [
+        models.Ref.album(name='Program 100', uri='podcast+ivoox:subs:f1100'),
+        models.Ref.album(name='Program 101 (1)',
+                         uri='podcast+ivoox:subs:f1101'),
+        models.Ref.directory(name='M\xe1s\u2026',
+                             uri='podcast+ivoox:subs:page=2'),
+    ]
+    assert [ref.uri for ref in more] == ['podcast+ivoox:subs:f1102']
+    assert [ref.type for ref in episodes] == ['track', 'track']
+
+
+@pytest.mark.parametrize('uri, parts', [
+    ('podcast+ivoox:explore', ('podcast+ivoox:explore', None, 1)),
+    ('podcast+ivoox:explore:f43', ('podcast+ivoox:explore', 'f43', 1)),
+    ('podcast+ivoox:explore:f43:page=3', ('podcast+ivoox:explore', 'f43', 3)),
+    ('podcast+ivoox:explore:page=2', ('podcast+ivoox:explore', None, 2)),
+    ('podcast+ivoox:list', ('podcast+ivoox:list', None, 1)),
+])
+def test_parse_and_make_uri(uri, parts):
+    assert backend.parse_uri(uri) == parts
+    assert backend.make_uri(*parts) == uri
+
+
+def test_parse_uri_takes_invalid_pages_as_first():
+    assert backend.parse_uri('podcast+ivoox:explore:f43:page=x') == \
+        ('podcast+ivoox:explore', 'f43', 1)
+    assert backend.parse_uri('podcast+ivoox:explore:page=0') == \
+        ('podcast+ivoox:explore', None, 1)
+
+
+def test_browse_adds_next_page_directory(library, server):
+    server.pages['podcasts_sc_f_2.html'] = pages.programs_page(6)
+    library.refresh()
+
+    refs = library.browse('podcast+ivoox:explore')
+
+    assert [ref.name for ref in refs[:5]] == \
+        ['Category {}'.format(i) for i in range(5)]
+    assert refs[-1] == models.Ref.directory(
+        name='M\xe1s\u2026', uri='podcast+ivoox:explore:page=2')
+
+
+def test_browse_next_page_loads_only_that_page(library, server):
+    server.pages['audios_sa_f_2.html'] = pages.episodes_page(2)
+
+    refs = library.browse('podcast+ivoox:explore:page=2')
+
+    # Nor a next page, as this one is not full
+    assert [ref.name for ref in refs] == ['Episode 1000', 'Episode 1001']
+    # The second page of programs was asked for by the first one
+    assert server.requests == [('GET', '/audios_sa_f_2.html')]
+
+
+@pytest.mark.parametrize('next_page', [
+    pages.episodes_page(0),
+    pages.episodes_page(5),
+])
+def test_browse_last_page_has_no_next_page(library, server, next_page):
+    server.pages['list_bk_list_abc_1.html'] = pages.episodes_page(5)
+    # Answered with the last page again, by iVoox
+    server.pages['list_bk_list_abc_2.html'] = next_page
+
+    refs = library.browse('podcast+ivoox:list:abc')
+
+    assert len(refs) == 5
+    assert all(ref.type == models.Ref.TRACK for ref in refs)
+
+
+def test_browse_pages_smaller_than_ivoox_pages(library, server):
+    library.config['max_programs'] = 3
+    server.pages['podcasts_sc_f_2.html'] = pages.programs_page(7)
+    library.refresh()
+
+    names = [[ref.name for ref in library.browse(uri)
+              if ref.type == models.Ref.ALBUM]
+             for uri in ('podcast+ivoox:explore:page=2',
+                         'podcast+ivoox:explore:page=3')]
+
+    # The rest of the first iVoox page comes before its second page
+    assert names == [['Program 103', 'Program 104', 'Program 100'],
+                     ['Program 101', 'Program 102', 'Program 103']]
+
+
+def test_lookup_browsed_episode_needs_no_request(library, server):
+    server.pages['audios_sa_f_2.html'] = pages.episodes_page(2)
+    refs = library.browse('podcast+ivoox:explore:page=2')
+    del server.requests[:]
+
+    tracks = library.lookup(refs[1].uri)
+
+    assert server.requests == []
+    assert refs[1].uri == 'podcast+ivoox:episode:f1100:1001'
+    assert len(tracks) == 1
+    assert tracks[0].name == 'Episode 1001'
+    assert tracks[0].length == 61000
+    assert tracks[0].date == '2026-10-18'
+    assert tracks[0].album.name == 'Program 100'
+    assert library.get_images([refs[1].uri]) == {refs[1].uri: [
+        models.Image(uri='http://static.ivoox.com/episode-1001.jpg')]}
+
+
+def test_lookup_many_fetches_each_missing_program_once(library, server):
+    server.pages['podcast_sq_f1200_1.html'] = pages.episodes_page(3, 200)
+    uris = ['podcast+ivoox:episode:f1200:1002',
+            'podcast+ivoox:episode:f1200:1000',
+            'podcast+ivoox:episode:f1200:9999']
+
+    results = library.lookup_many(uris)
+
+    assert server.requests == [('GET', '/podcast_sq_f1200_1.html'),
+                               ('GET', '/podcast_fg_f1200_filtro_1.xml')]
+    assert [track.name for track in results[uris[0]]] == ['Episode 1002']
+    assert [track.name for track in results[uris[1]]] == ['Episode 1000']
+    assert results[uris[2]] == []
+
+
+def test_lookup_older_episodes_from_program_feed(library, server):
+    server.pages['podcast_sq_f1200_1.html'] = pages.episodes_page(3, 200)
+    server.pages['podcast_fg_f1200_filtro_1.xml'] = \
+        pages.feed_page(range(1002, 999, -1), 200)
+    server.pages['podcast_fg_f1200_filtro_2.xml'] = \
+        pages.feed_page([901, 900], 200)
+    server.pages['podcast_fg_f1200_filtro_3.xml'] = \
+        pages.feed_page([899], 200)
+    uri = 'podcast+ivoox:episode:f1200:901'
+
+    tracks = library.lookup(uri)
+
+    assert [track.name for track in tracks] == ['Episode 901']
+    assert tracks[0].uri == uri
+    assert tracks[0].length == 61000
+    assert tracks[0].date == '2026-10-18'
+    assert tracks[0].album.name == 'Program 200'
+    assert library.get_images([uri]) == {uri: [
+        models.Image(uri='http://static.ivoox.com/episode-901.jpg')]}
+    # The whole feed is stored, for the other older episodes
+    del server.requests[:]
+    library.lookup('podcast+ivoox:episode:f1200:899')
+    assert server.requests == []
+
+
+def test_playback_translates_episodes_to_audio_urls(config):
+    provider = backend.IVooxPlaybackProvider(audio=None, backend=None)
+
+    assert provider.translate_uri('podcast+ivoox:episode:f1100:1001') == \
+        'http://www.ivoox.com/listen_mn_1001_1.mp3'
+    assert provider.translate_uri('podcast+ivoox:explore') is None
+
+
+def test_playback_translates_to_resolved_audio_urls(config):
+    resolver = mock.Mock(get=lambda url: url.replace('listen', 'media'))
+    provider = backend.IVooxPlaybackProvider(audio=None, backend=None,
+                                             resolver=resolver)
+
+    assert provider.translate_uri('podcast+ivoox:episode:f1100:1001') == \
+        'http://www.ivoox.com/media_mn_1001_1.mp3'
+
+    provider.prefetch(['podcast+ivoox:episode:f1100:1002', 'file:///a.mp3'])
+    resolver.prefetch.assert_called_once_with(
+        ['http://www.ivoox.com/listen_mn_1002_1.mp3'])
+
+
+def test_metrics_time_each_stage(config, server):
+    config['podcast-ivoox']['metrics'] = True
+    with mock.patch('mopidy_podcast_ivoox.ivooxapi.get_baseurl',
+                    return_value=server.url):
+        library = backend.IVooxLibraryProvider(config, backend=None)
+        library._startup.join()
+        library.browse('podcast+ivoox:explore')
+        library.browse('podcast+ivoox:explore')
+        library.ivoox.close()
+
+    metrics = library.get_metrics()
+    stages = metrics['stages']
+    assert set(stages) == {'fetch', 'parse', 'extract', 'translate', 'browse'}
+    # Its first page, and the second one telling there are no more
+    assert stages['fetch']['EXPLORE_PROGRAMS']['count'] == 2
+    assert stages['browse']['podcast+ivoox:explore']['count'] >= 2
+    assert metrics['cache']['hit_ratio'] > 0
+    assert metrics['in_flight'] == {}
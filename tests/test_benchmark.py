@@ -0,0 +1,53 @@
+from __future__ import unicode_literals
+
+import pytest
+
+from . import benchmark
+
+
+@pytest.mark.parametrize('name', sorted(benchmark.FIXTURES))
+def test_fixtures_have_the_requested_items(name):
+    result = benchmark.run_case(name, 20, repeat=1)
+
+    assert result['items'] == (1 if name == 'CheckLogin' else 20)
+    assert result['items_per_sec'] > 0
+    assert set(result['field_us']) == \
+        set(benchmark.FIXTURES[name][0]()._fieldlist)
+
+
+def test_cases_run_on_their_own_process():
+    results = benchmark.run(['CheckLogin'], sizes=(20,), repeat=1)
+
+    assert [(result['scrapper'], result['items']) for result in results] \
+        == [('CheckLogin', 1)]
+    assert result['peak_memory_kb'] >= 0
+
+
+def test_regressions_beyond_tolerance_fail():
+    baselines = {'IVooxEpisodes:100': {'items_per_sec': 1000,
+                                       'peak_memory_kb': 4096}}
+    result = {'scrapper': 'IVooxEpisodes', 'size': 100,
+              'items_per_sec': 600, 'peak_memory_kb': 5000,
+              'item_bytes': 1000}
+
+    assert benchmark.regressions([result], baselines, tolerance=0.5) == []
+
+    result.update(items_per_sec=400, peak_memory_kb=10000)
+    failures = benchmark.regressions([result], baselines, tolerance=0.5)
+
+    assert len(failures) == 2
+    assert 'items/sec' in failures[0]
+    assert 'peak memory' in failures[1]
+
+
+def test_peak_memory_below_a_megabyte_is_noise():
+    baselines = {'IVooxEpisodes:20': {'items_per_sec': 1000,
+                                      'peak_memory_kb': 0}}
+    result = {'scrapper': 'IVooxEpisodes', 'size': 20,
+              'items_per_sec': 1000, 'peak_memory_kb': 1000,
+              'item_bytes': 1000}
+
+    assert benchmark.regressions([result], baselines) == []
+
+    result.update(peak_memory_kb=2000)
+    assert len(benchmark.regressions([result], baselines)) == 1
@@ -0,0 +1,64 @@
+from __future__ import unicode_literals
+
+import pytest
+
+from mopidy_podcast_ivoox.breaker import CircuitBreaker
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown=60, clock=clock)
+    breaker.failure('EXPLORE_EPISODES')
+    breaker.failure('EXPLORE_EPISODES')
+    breaker.success('EXPLORE_EPISODES')
+    breaker.failure('EXPLORE_EPISODES')
+    breaker.failure('EXPLORE_EPISODES')
+    assert breaker.allow('EXPLORE_EPISODES')
+
+    breaker.failure('EXPLORE_EPISODES')
+
+    assert not breaker.allow('EXPLORE_EPISODES')
+    assert breaker.allow('EXPLORE_PROGRAMS')
+    assert breaker.state() == {
+        'EXPLORE_EPISODES': {'failures': 3, 'open': True}}
+
+
+def test_single_trial_after_cooldown(clock):
+    breaker = CircuitBreaker(threshold=1, cooldown=60, clock=clock)
+    breaker.failure('URL_PROGRAM')
+
+    clock.now = 61
+    assert breaker.allow('URL_PROGRAM')
+    assert not breaker.allow('URL_PROGRAM')
+
+    # Failed trial opens it for another cooldown
+    breaker.failure('URL_PROGRAM')
+    clock.now = 100
+    assert not breaker.allow('URL_PROGRAM')
+
+    clock.now = 200
+    assert breaker.allow('URL_PROGRAM')
+    breaker.success('URL_PROGRAM')
+    assert breaker.allow('URL_PROGRAM')
+    assert breaker.state() == {}
+
+
+def test_no_threshold_never_opens(clock):
+    breaker = CircuitBreaker(threshold=0, clock=clock)
+    for _ in range(10):
+        breaker.failure('URL_PROGRAM')
+
+    assert breaker.allow('URL_PROGRAM')
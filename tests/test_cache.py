@@ -0,0 +1,89 @@
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from mopidy_podcast_ivoox.cache import ResponseCache, SingleFlight
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_returns_cached_value_and_counts_hits():
+    cache = ResponseCache()
+    cache.set('key', 'value', ttl=10)
+
+    assert cache.get('key') == 'value'
+    assert cache.get('other') is None
+    assert cache.stats() == {'size': 1, 'hits': 1, 'misses': 1}
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = ResponseCache(clock=clock)
+    cache.set('short', 1, ttl=10)
+    cache.set('long', 2, ttl=100)
+
+    clock.now = 50
+
+    assert cache.get('short') is None
+    assert cache.get('long') == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(maxsize=2)
+    cache.set('a', 1, ttl=10)
+    cache.set('b', 2, ttl=10)
+    cache.get('a')
+    cache.set('c', 3, ttl=10)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+
+def test_invalidate_drops_matching_keys():
+    cache = ResponseCache()
+    cache.set(('explore', 1), 1, ttl=10)
+    cache.set(('explore', 2), 2, ttl=10)
+    cache.set(('search', 1), 3, ttl=10)
+
+    cache.invalidate(lambda key: key[0] == 'explore')
+
+    assert len(cache) == 1
+    assert cache.get(('search', 1)) == 3
+
+
+def test_single_flight_merges_concurrent_calls():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow(value):
+        calls.append(value)
+        started.set()
+        release.wait()
+        return value * 2
+
+    leader = threading.Thread(target=flight.do, args=('key', slow, 1))
+    leader.start()
+    started.wait()
+    results = []
+    follower = threading.Thread(
+        target=lambda: results.append(flight.do('key', slow, 1)))
+    follower.start()
+    while not flight.merged:
+        time.sleep(0.01)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert calls == [1]
+    assert results == [2]
+    assert flight.merged == 1
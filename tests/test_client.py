@@ -0,0 +1,333 @@
+from __future__ import unicode_literals
+
+import time
+from functools import partial
+
+import pytest
+import requests
+
+from mopidy_podcast_ivoox.client import IVooxClient
+from mopidy_podcast_ivoox.store import ScrapStore
+
+from . import pages
+from .fake_ivoox import FakeIVoox
+from .stub_server import StubServer
+
+
+DELAY = 0.3
+
+
+@pytest.fixture
+def server():
+    stub = StubServer(pages={
+        'audios_sa_f_1.html': pages.categories_page(5),
+        'audios_sa_f43_1.html': pages.episodes_page(10),
+        'podcasts_sc_f43_1.html': pages.programs_page(10),
+    }, delay=DELAY)
+    with stub:
+        yield stub
+
+
+@pytest.fixture
+def client(server):
+    ivoox = IVooxClient(workers=3, baseurl=server.url)
+    yield ivoox
+    ivoox.close()
+
+
+def test_parallel_fetches_concurrently(client, server):
+    start = time.time()
+    categories, episodes, programs = client.parallel(
+        partial(client.get_categories),
+        partial(client.explore, category='f43', type='episodes'),
+        partial(client.explore, category='f43', type='programs'))
+    elapsed = time.time() - start
+
+    assert len(server.requests) == 3
+    assert elapsed < 2 * DELAY
+    assert [item['code'] for item in categories] == \
+        ['f4{}'.format(i) for i in range(5)]
+    assert episodes[0]['name'] == 'Episode 1000'
+    assert programs[0]['name'] == 'Program 100'
+
+
+def test_parallel_propagates_errors(client):
+    def fail():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        client.parallel(list, fail)
+
+
+def test_results_are_cached_per_arguments(client, server):
+    client.explore(category='f43', type='episodes')
+    client.explore(category='f43', type='episodes')
+    client.explore(category='f43', type='programs')
+
+    assert len(server.requests) == 2
+
+
+def test_invalidate_drops_only_matching_entries(client, server):
+    client.get_categories()
+    client.explore(category='f43', type='episodes')
+
+    client.invalidate('explore', category='f43')
+    client.get_categories()
+    client.explore(category='f43', type='episodes')
+
+    assert [path for _, path in server.requests] == [
+        '/audios_sa_f_1.html',
+        '/audios_sa_f43_1.html',
+        '/audios_sa_f43_1.html',
+    ]
+
+
+def test_scrappers_share_kept_alive_connections(server):
+    server.delay = 0
+    client = IVooxClient(workers=1, baseurl=server.url)
+
+    client.get_categories()
+    client.explore(category='f43', type='episodes')
+    client.explore(category='f43', type='programs')
+    client.close()
+
+    assert len(server.requests) == 3
+    assert len(server.connections) == 1
+
+
+def test_requests_time_out(server):
+    client = IVooxClient(timeout=(1, DELAY / 3), retries=0,
+                         baseurl=server.url)
+
+    with pytest.raises(requests.exceptions.RequestException):
+        client.get_categories()
+    client.close()
+
+
+def test_stored_results_are_served_and_revalidated(server, tmpdir):
+    path = str(tmpdir.join('scraps.db'))
+    server.delay = 0
+    client = IVooxClient(store=ScrapStore(path), baseurl=server.url)
+    expected = client.get_categories()
+    client.close()
+
+    server.delay = 1
+    server.requests[:] = []
+    client = IVooxClient(store=ScrapStore(path), baseurl=server.url)
+    start = time.time()
+    categories = client.get_categories()
+    elapsed = time.time() - start
+
+    assert categories == expected
+    assert elapsed < server.delay
+    time.sleep(1.5 * server.delay)
+    assert len(server.requests) == 1
+
+    assert client.get_categories() == expected
+    assert client.get_categories() == expected
+    assert len(server.requests) == 1
+    client.close()
+
+
+def test_refreshed_pages_are_fetched_before_answering(server, tmpdir):
+    path = str(tmpdir.join('scraps.db'))
+    server.delay = 0
+    client = IVooxClient(store=ScrapStore(path), baseurl=server.url)
+    client.explore(category='f43', type='episodes')
+
+    client.clear_cache()
+    server.pages['audios_sa_f43_1.html'] = pages.episodes_page(3)
+    episodes = client.explore(category='f43', type='episodes')
+
+    assert len(episodes) == 3
+    assert len(server.requests) == 2
+    client.close()
+
+
+def test_not_modified_pages_reuse_stored_results(server, client):
+    server.delay = 0
+    server.etags = True
+    expected = client.explore(category='f43', type='episodes')
+
+    client.invalidate('explore')
+    episodes = client.explore(category='f43', type='episodes')
+
+    assert episodes == expected
+    assert len(server.requests) == 2
+    savings = client.savings['EXPLORE_EPISODES']
+    assert savings['not_modified'] == 1
+    assert savings['bytes_saved'] == len(server.pages['audios_sa_f43_1.html'])
+
+
+def test_unchanged_pages_are_not_stored_again(server, client):
+    server.delay = 0
+    expected = client.explore(category='f43', type='programs')
+
+    client.invalidate('explore')
+    programs = client.explore(category='f43', type='programs')
+
+    assert programs == expected
+    assert len(server.requests) == 2
+    savings = client.savings['EXPLORE_PROGRAMS']
+    assert savings['unchanged'] == 1
+    assert savings['parse_time_saved'] > 0
+
+
+def test_unchanged_capped_pages_are_not_stored_again(server, client):
+    server.delay = 0
+    expected = client.explore(category='f43', type='programs', max_items=2)
+
+    client.invalidate('explore')
+    programs = client.explore(category='f43', type='programs', max_items=2)
+
+    assert programs == expected
+    assert client.savings['EXPLORE_PROGRAMS']['unchanged'] == 1
+
+
+def test_concurrent_scraps_share_one_request(client, server):
+    results = client.parallel(*[
+        partial(client.explore, category='f43', type='programs')
+        for _ in range(3)])
+
+    assert len(server.requests) == 1
+    assert client.merged_requests == 2
+    assert results[0] == results[1] == results[2]
+
+
+@pytest.fixture
+def login_server():
+    stub = StubServer(pages={
+        'ajx-login_zl.html': pages.PAGE.format(''),
+        '': pages.home_page(user='someone'),
+        'gestionar-suscripciones_je_1.html?order=date':
+            pages.subscriptions_page(3),
+    }, post_redirects={'ajx-login_zl.html': ''})
+    with stub:
+        yield stub
+
+
+def test_login_state_comes_from_login_response(login_server):
+    client = IVooxClient(baseurl=login_server.url)
+
+    assert client.login('someone', 'secret')
+    assert client.user_logged()
+    assert login_server.requests == [
+        ('GET', '/ajx-login_zl.html'),
+        ('POST', '/ajx-login_zl.html'),
+        ('GET', '/'),
+    ]
+    client.close()
+
+
+class _Once(dict):
+    # Redirects followed only the first time
+    def get(self, key, default=None):
+        return self.pop(key, default)
+
+
+def test_expired_sessions_log_in_again(login_server):
+    client = IVooxClient(baseurl=login_server.url)
+    client.login('someone', 'secret')
+    login_server.redirects = _Once({
+        'gestionar-suscripciones_je_1.html?order=date': 'ajx-login_zl.html'})
+    del login_server.requests[:]
+
+    subscriptions = client.get_subscriptions()
+
+    assert len(subscriptions) == 3
+    assert client.user_logged()
+    assert login_server.requests.count(('POST', '/ajx-login_zl.html')) == 1
+    client.close()
+
+
+def test_expired_sessions_results_are_not_cached(login_server):
+    client = IVooxClient(baseurl=login_server.url)
+    client.login('someone', 'secret')
+    client._credentials = None
+    login_server.redirects = _Once({
+        'gestionar-suscripciones_je_1.html?order=date': 'ajx-login_zl.html'})
+
+    assert client.get_subscriptions() == []
+    assert not client.user_logged()
+    assert len(client.get_subscriptions()) == 3
+    client.close()
+
+
+def test_other_redirects_do_not_expire_sessions(login_server):
+    client = IVooxClient(baseurl=login_server.url)
+    client.login('someone', 'secret')
+    login_server.pages['subscriptions.html'] = pages.subscriptions_page(2)
+    login_server.redirects = _Once({
+        'gestionar-suscripciones_je_1.html?order=date': 'subscriptions.html'})
+    del login_server.requests[:]
+
+    assert len(client.get_subscriptions()) == 2
+    assert client.user_logged()
+    assert ('POST', '/ajx-login_zl.html') not in login_server.requests
+    client.close()
+
+
+def test_no_credentials_is_not_logged_without_requests(login_server):
+    client = IVooxClient(baseurl=login_server.url)
+
+    assert not client.login(None, None)
+    assert not client.user_logged()
+    assert login_server.requests == []
+    client.close()
+
+
+def test_session_expiry_is_detected_from_redirects(login_server):
+    client = IVooxClient(baseurl=login_server.url)
+    client.login('someone', 'secret')
+    login_server.redirects[
+        'gestionar-suscripciones_je_1.html?order=date'] = 'ajx-login_zl.html'
+    del login_server.requests[:]
+
+    assert client.get_subscriptions() == []
+    # Logged in again, and asked once more, just once
+    assert login_server.requests.count(('POST', '/ajx-login_zl.html')) == 1
+    client.close()
+
+
+@pytest.fixture
+def fake():
+    with FakeIVoox() as server:
+        yield server
+
+
+def test_stored_results_are_served_when_ivoox_fails(fake):
+    client = IVooxClient(baseurl=fake.url, retries=0, error_budget=2)
+    episodes = client.explore(category='f40')
+    client.invalidate('explore')
+    fake.error_rate = 1
+
+    assert client.explore(category='f40') == episodes
+    assert client.explore(category='f40') == episodes
+    # Circuit open: iVoox is not asked anymore
+    del fake.requests[:]
+    assert client.explore(category='f40') == episodes
+    assert fake.requests == []
+    assert client.stats()['breakers'] == {
+        'EXPLORE_EPISODES': {'failures': 2, 'open': True}}
+
+    with pytest.raises(requests.RequestException):
+        client.explore(category='f41')
+    client.close()
+
+
+def test_stored_results_are_served_over_latency_budget(fake):
+    client = IVooxClient(baseurl=fake.url, latency_budget=0.1)
+    episodes = client.explore(category='f40')
+    client.invalidate('explore')
+    fake.latency = 0.5
+
+    start = time.time()
+    assert client.explore(category='f40') == episodes
+    assert time.time() - start < fake.latency
+
+    # Once fetched in the background, results are served without waiting
+    time.sleep(2 * fake.latency)
+    del fake.requests[:]
+    assert client.explore(category='f40') == episodes
+    assert fake.requests == []
+    client.close()
@@ -1,6 +1,6 @@
 from __future__ import unicode_literals
 
-from mopidy_podcast-ivoox import Extension, frontend as frontend_lib
+from mopidy_podcast_ivoox import Extension
 
 
 def test_get_default_config():
@@ -17,9 +17,6 @@ def test_get_config_schema():
 
     schema = ext.get_config_schema()
 
-    # TODO Test the content of your config schema
-    #assert 'username' in schema
-    #assert 'password' in schema
-
-
-# TODO Write more tests
+    assert 'username' in schema
+    assert 'password' in schema
+    assert 'workers' in schema
@@ -0,0 +1,173 @@
+from __future__ import unicode_literals
+
+import mock
+import pytest
+import requests
+import tornado.testing
+import tornado.web
+from lxml import etree
+
+from mopidy_podcast_ivoox import feeds, ivooxapi, web
+from mopidy_podcast_ivoox.feeds import FeedCache
+
+from .stub_server import StubServer
+
+
+FEED = ('<?xml version="1.0"?><rss><channel><title>Program 100</title>'
+        '{}</channel></rss>')
+ITEM = '<item><guid>{0}</guid><title>Episode {0}</title></item>'
+
+
+def feed_page(*guids):
+    return FEED.format(''.join(ITEM.format(guid) for guid in guids))
+
+
+@pytest.fixture
+def server():
+    stub = StubServer(pages={
+        'podcast_fg_f1100_filtro_1.xml': feed_page(5, 4),
+        'podcast_fg_f1100_filtro_2.xml': feed_page(3, 2),
+        'podcast_fg_f1100_filtro_3.xml': feed_page(1),
+    }, etags=True)
+    with stub:
+        yield stub
+
+
+@pytest.fixture
+def feed_cache(server):
+    feed_cache = FeedCache(requests.session(),
+                           ivooxapi.UrlContext(server.url))
+    yield feed_cache
+    feed_cache.close()
+
+
+def _guids(feed):
+    return [int(guid) for guid in etree.fromstring(feed.content).xpath(
+        '/rss/channel/item/guid/text()')]
+
+
+def test_format_feed_page():
+    assert ivooxapi.format_feed_page('podcast_fg_f1100.xml', 2) == \
+        'podcast_fg_f1100_filtro_2.xml'
+    with pytest.raises(ValueError):
+        ivooxapi.format_feed_page('podcast_sq_f1100_1.html')
+
+
+def test_feeds_are_built_from_every_page(server, feed_cache):
+    feed = feed_cache.get('podcast_fg_f1100.xml')
+
+    assert _guids(feed) == [5, 4, 3, 2, 1]
+    assert b'<title>Program 100</title>' in feed.content
+    assert [path for _, path in server.requests] == [
+        '/podcast_fg_f1100_filtro_1.xml', '/podcast_fg_f1100_filtro_2.xml',
+        '/podcast_fg_f1100_filtro_3.xml', '/podcast_fg_f1100_filtro_4.xml']
+
+
+def test_feeds_are_served_as_stored_until_revalidated(server, feed_cache):
+    feed_cache.get('podcast_fg_f1100.xml')
+    feed_cache.get('podcast_fg_f1100.xml')
+    assert len(server.requests) == 4
+
+    feed_cache._ttl = 0
+    feed = feed_cache.get('podcast_fg_f1100.xml')
+
+    assert _guids(feed) == [5, 4, 3, 2, 1]
+    # Only the first page is asked for, and it was not modified
+    assert server.requests[4:] == [('GET', '/podcast_fg_f1100_filtro_1.xml')]
+
+
+def test_new_episodes_go_on_top_of_the_stored_ones(server, feed_cache):
+    feed_cache.get('podcast_fg_f1100.xml')
+    feed_cache._ttl = 0
+    server.pages['podcast_fg_f1100_filtro_1.xml'] = feed_page(6, 5)
+    server.pages['podcast_fg_f1100_filtro_2.xml'] = feed_page(4, 3)
+    del server.requests[:]
+
+    feed = feed_cache.get('podcast_fg_f1100.xml')
+
+    assert _guids(feed) == [6, 5, 4, 3, 2, 1]
+    assert server.requests == [('GET', '/podcast_fg_f1100_filtro_1.xml')]
+
+
+def test_older_pages_are_fetched_down_to_a_stored_episode(server,
+                                                          feed_cache):
+    feed_cache.get('podcast_fg_f1100.xml')
+    feed_cache._ttl = 0
+    server.pages['podcast_fg_f1100_filtro_1.xml'] = feed_page(8, 7)
+    server.pages['podcast_fg_f1100_filtro_2.xml'] = feed_page(6, 5)
+    server.pages['podcast_fg_f1100_filtro_3.xml'] = feed_page(4, 3)
+    del server.requests[:]
+
+    feed = feed_cache.get('podcast_fg_f1100.xml')
+
+    assert _guids(feed) == [8, 7, 6, 5, 4, 3, 2, 1]
+    assert len(server.requests) == 2
+
+
+def test_repeated_last_pages_end_the_feed(server, feed_cache):
+    # Pages out of range answered with the last one
+    server.pages['podcast_fg_f1100_filtro_4.xml'] = feed_page(1)
+
+    feed = feed_cache.get('podcast_fg_f1100.xml')
+
+    assert _guids(feed) == [5, 4, 3, 2, 1]
+    assert len(server.requests) == 4
+
+
+def test_stored_feeds_are_served_if_ivoox_fails(server, feed_cache):
+    feed_cache.get('podcast_fg_f1100.xml')
+    feed_cache._ttl = 0
+    feed_cache._session = mock.Mock(
+        get=mock.Mock(side_effect=requests.ConnectionError))
+
+    assert _guids(feed_cache.get('podcast_fg_f1100.xml')) == [5, 4, 3, 2, 1]
+    with pytest.raises(requests.ConnectionError):
+        feed_cache.get('podcast_fg_f1200.xml')
+
+
+def test_missing_feeds_are_none(feed_cache):
+    assert feed_cache.get('podcast_fg_f1200.xml') is None
+
+
+def test_least_recently_fetched_feeds_are_pruned(server, feed_cache):
+    server.pages['podcast_fg_f1200_filtro_1.xml'] = feed_page(10)
+    feed_cache.max_feeds = 1
+    feed_cache.get('podcast_fg_f1100.xml')
+    feed_cache.get('podcast_fg_f1200.xml')
+    del server.requests[:]
+
+    assert len(feed_cache) == 1
+    feed_cache.get('podcast_fg_f1200.xml')
+    assert server.requests == []
+    feed_cache.get('podcast_fg_f1100.xml')
+    assert len(server.requests) == 4
+
+
+class FeedHandlerTest(tornado.testing.AsyncHTTPTestCase):
+
+    def setUp(self):
+        self.feed_cache = mock.Mock()
+        patcher = mock.patch.object(web, '_get_backend')
+        patcher.start().return_value.feed_cache.get.return_value = \
+            self.feed_cache
+        self.addCleanup(patcher.stop)
+        super(FeedHandlerTest, self).setUp()
+
+    def get_app(self):
+        return tornado.web.Application(web.http_factory({}, None))
+
+    def test_serves_complete_feeds(self):
+        self.feed_cache.get.return_value = feeds.Feed(
+            feed_page(2, 1).encode('utf-8'), 0, None, None, None)
+
+        response = self.fetch('/feeds/podcast_fg_f1100.xml')
+
+        assert response.code == 200
+        assert response.body == feed_page(2, 1).encode('utf-8')
+        assert response.headers['Content-Type'] == 'application/rss+xml'
+        self.feed_cache.get.assert_called_once_with('podcast_fg_f1100.xml')
+
+    def test_missing_feeds_are_not_found(self):
+        self.feed_cache.get.return_value = None
+
+        assert self.fetch('/feeds/podcast_fg_f1100.xml').code == 404
@@ -0,0 +1,79 @@
+from __future__ import unicode_literals
+
+import types
+
+import mock
+import mopidy
+from mopidy import listener, models
+
+import mopidy_podcast_ivoox.backend  # noqa: F401
+
+try:
+    from mopidy_podcast_ivoox.frontend import IVooxFrontend
+except ImportError:
+    # Mopidy core needs GStreamer bindings, only its listener is used here
+    core = types.ModuleType(str('mopidy.core'))
+    core.CoreListener = type(str('CoreListener'), (listener.Listener,), {})
+    with mock.patch.dict('sys.modules', {'mopidy.core': core}), \
+            mock.patch.object(mopidy, 'core', core, create=True):
+        from mopidy_podcast_ivoox.frontend import IVooxFrontend
+
+
+def _tl_tracks(*uris):
+    return [models.TlTrack(tlid, models.Track(uri=uri))
+            for tlid, uri in enumerate(uris)]
+
+
+def _frontend(current, tl_tracks, count=2, repeat=False):
+    def eot_track(tl_track):
+        index = 0 if tl_track is None else tl_tracks.index(tl_track) + 1
+        if repeat:
+            index %= len(tl_tracks)
+        return mock.Mock(get=mock.Mock(
+            return_value=tl_tracks[index] if index < len(tl_tracks)
+            else None))
+
+    core = mock.Mock()
+    core.playback.get_current_tl_track.return_value.get.return_value = \
+        None if current is None else tl_tracks[current]
+    core.tracklist.eot_track.side_effect = eot_track
+    return IVooxFrontend({'podcast-ivoox': {'prefetch_tracks': count}}, core)
+
+
+@mock.patch('pykka.ActorRegistry.get_by_class')
+def test_next_episodes_are_prefetched(get_by_class):
+    frontend = _frontend(0, _tl_tracks(
+        'podcast+ivoox:episode:f1100:1000',
+        'file:///some.mp3',
+        'podcast+ivoox:episode:f1100:1002',
+        'podcast+ivoox:episode:f1100:1003'))
+
+    frontend.track_playback_started(None)
+
+    playback = get_by_class.return_value[0].proxy.return_value.playback
+    playback.prefetch.assert_called_once_with(
+        ['podcast+ivoox:episode:f1100:1002'])
+
+
+@mock.patch('pykka.ActorRegistry.get_by_class')
+def test_nothing_is_prefetched_without_next_episodes(get_by_class):
+    _frontend(None, _tl_tracks('file:///some.mp3')).tracklist_changed()
+    _frontend(0, _tl_tracks('podcast+ivoox:episode:f1100:1000'),
+              count=0).tracklist_changed()
+
+    assert not get_by_class.called
+
+
+@mock.patch('pykka.ActorRegistry.get_by_class')
+def test_next_episodes_are_prefetched_as_played(get_by_class):
+    tl_tracks = _tl_tracks('podcast+ivoox:episode:f1100:1000',
+                           'podcast+ivoox:episode:f1100:1001')
+
+    _frontend(1, tl_tracks, count=3, repeat=True).track_playback_started(None)
+    _frontend(None, tl_tracks, count=1).tracklist_changed()
+
+    playback = get_by_class.return_value[0].proxy.return_value.playback
+    assert playback.prefetch.call_args_list == [
+        mock.call(['podcast+ivoox:episode:f1100:1000']),
+        mock.call(['podcast+ivoox:episode:f1100:1000']),
+    ]
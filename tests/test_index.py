@@ -0,0 +1,100 @@
+# -*- coding: utf8 -*-
+from __future__ import unicode_literals
+
+import pytest
+
+from mopidy_podcast_ivoox import ivooxapi
+from mopidy_podcast_ivoox.index import SearchIndex, tokenize
+
+
+def _episode(number, name, program='Some program', description=''):
+    return {'url': 'http://www.ivoox.com/episode_rf_{}_1.html'.format(number),
+            'name': name, 'program': program, 'genre': 'Ciencia',
+            'description': description}
+
+
+@pytest.fixture
+def index():
+    index = SearchIndex()
+    index.add('episodes', [
+        _episode(1, 'Historia de España', description='Los Reyes Católicos'),
+        _episode(2, 'La corrupção no Brasil', program='Notícias'),
+        _episode(3, 'Astronomía', program='Historia del cosmos'),
+    ])
+    yield index
+    index.close()
+
+
+def test_tokenize_ignores_case_accents_and_punctuation():
+    assert tokenize('¿Qué pasó, José? Ep. 3') == \
+        ['que', 'paso', 'jose', 'ep', '3']
+
+
+def test_search_is_accent_insensitive(index):
+    assert [item['name'] for item in index.search('ESPANA')] == \
+        ['Historia de España']
+    assert [item['name'] for item in index.search('corrupcao noticias')] == \
+        ['La corrupção no Brasil']
+
+
+def test_search_ranks_names_over_other_fields(index):
+    assert [item['name'] for item in index.search('historia')] == \
+        ['Historia de España', 'Astronomía']
+
+
+def test_search_matches_every_word_and_prefixes_of_the_last(index):
+    assert [item['name'] for item in index.search('reyes cat')] == \
+        ['Historia de España']
+    assert index.search('reyes cosmos') == []
+    assert index.search('astro', type='programs') == []
+
+
+def test_items_are_updated_and_returned_as_records(index):
+    index.add('episodes', [_episode(3, 'Astrofísica')])
+
+    record = ivooxapi.IVooxEpisodes().record
+    items = index.search('astro', record=record)
+
+    assert len(index) == 3
+    assert [(item.name, item.guid) for item in items] == [('Astrofísica', '3')]
+
+
+def test_items_are_indexed_in_the_background(index):
+    index.add_later('episodes', [_episode(4, 'Historia de Roma')])
+    index.add_later('categories', [_episode(5, 'Historia')])
+    index.add_later('episodes', [_episode(6, 'Historia de Grecia')])
+    index.flush()
+
+    assert len(index) == 5
+    assert [item['name'] for item in index.search('historia de')] == \
+        ['Historia de España', 'Historia de Roma', 'Historia de Grecia',
+         'Astronomía']
+
+
+def test_least_recently_updated_items_are_pruned(index):
+    index.max_items = 3
+    index.add('episodes', [_episode(4, 'Historia de Roma')])
+
+    assert len(index) == 3
+    assert [item['name'] for item in index.search('historia')] == \
+        ['Historia de Roma', 'Astronomía']
+
+
+def test_index_is_persisted(tmpdir):
+    path = str(tmpdir.join('search.db'))
+    SearchIndex(path).add('episodes', [_episode(1, 'Fútbol')])
+
+    assert [item['name'] for item in SearchIndex(path).search('futbol')] == \
+        ['Fútbol']
+
+
+def test_index_is_cleared_for_another_site(tmpdir):
+    path = str(tmpdir.join('search.db'))
+    SearchIndex(path, site='http://www.ivoox.com/').add(
+        'episodes', [_episode(1, 'Fútbol')])
+
+    assert len(SearchIndex(path, site='http://www.ivoox.com/')) == 1
+    assert len(SearchIndex(path)) == 1
+    index = SearchIndex(path, site='http://mx.ivoox.com/es/')
+    assert len(index) == 0
+    assert index.search('futbol') == []
@@ -0,0 +1,96 @@
+from __future__ import unicode_literals
+
+import datetime
+
+import pytest
+
+from mopidy_podcast_ivoox import ivooxapi
+
+
+@pytest.mark.parametrize('name, args', [
+    ('LOGIN', ()),
+    ('EXPLORE_EPISODES', ('f', 1)),
+    ('EXPLORE_PROGRAMS', ('f43', 2)),
+    ('EXPLORE_LISTS', ('abc', 1)),
+    ('SUBSCRIPTIONS', ()),
+    ('SEARCH_EPISODES', ('some-text', 1)),
+    ('SEARCH_PROGRAMS', ('some-text', 1)),
+    ('SEARCH_CHANNELS', ('some-text', 1)),
+    ('LIST_INDEX', ()),
+    ('LIST_HOME', ()),
+    ('LIST_PENDING', (1,)),
+])
+def test_parse_endpoint(name, args):
+    assert ivooxapi.parse_endpoint(ivooxapi.format_url(name, *args)) == name
+
+
+def test_parse_endpoint_unknown_url():
+    assert ivooxapi.parse_endpoint('unknown.html') is None
+
+
+def test_url_context_is_shared_per_site():
+    context = ivooxapi.get_url_context('EN', 'US')
+
+    assert context is ivooxapi.get_url_context('EN', 'US')
+    assert context is not ivooxapi.get_url_context('ES', 'ES')
+    assert context.absolute('podcast_fg_f11.xml') == \
+        'http://us.ivoox.com/en/podcast_fg_f11.xml'
+    assert context.absolute('podcast_fg_f11.xml') is \
+        context.absolute('podcast_fg_f11.xml')
+
+
+def test_parse_feed_code():
+    assert ivooxapi.parse_feed_code('podcast_fg_f1100.xml') == 'f1100'
+    assert ivooxapi.parse_feed_code(
+        'http://www.ivoox.com/podcast_fg_f1100.xml') == 'f1100'
+    assert ivooxapi.parse_feed_code('podcast_sq_f1100_1.html') is None
+
+
+def test_parse_feed_xml_is_memoized():
+    url = 'http://www.ivoox.com/podcast-program_sq_f1234_1.html'
+
+    assert ivooxapi.parse_feed_xml(url) == 'podcast_fg_f1234.xml'
+    assert ivooxapi.parse_feed_xml(url) is ivooxapi.parse_feed_xml(url)
+
+
+@pytest.mark.parametrize('fuzzy_date, date', [
+    ('hoy', '2026-10-18'),
+    (b'Ayer', '2026-10-17'),
+    ('anteayer', '2026-10-16'),
+    ('hace 3 d\xedas', '2026-10-15'),
+    ('2 semanas', '2026-10-04'),
+    ('hace un mes', '2026-09'),
+    ('3 a\xf1os', '2023'),
+    ('3 days ago', '2026-10-15'),
+    ('h\xe1 2 meses', '2026-08'),
+    ('5 giorni fa', '2026-10-13'),
+    ('il y a 2 ans', '2024'),
+    ('avant-hier', '2026-10-16'),
+    ('vor einem Jahr', '2025'),
+    ('hace 2 horas', '2026-10-18'),
+    ('pronto', None),
+    ('', None),
+    (None, None),
+])
+def test_parse_fuzzy_date(fuzzy_date, date):
+    today = datetime.date(2026, 10, 18)
+
+    assert ivooxapi.parse_fuzzy_date(fuzzy_date, today=today) == date
+
+
+def test_parse_date():
+    assert ivooxapi.parse_date('18/10/2025') == '2025-10-18'
+    assert ivooxapi.parse_date('ayer', today=datetime.date(2026, 10, 18)) \
+        == '2026-10-17'
+    assert ivooxapi.parse_date(None) is None
+    assert ivooxapi.parse_date('') is None
+    assert ivooxapi.parse_date('  ') is None
+
+
+def test_parse_subscription_date():
+    today = datetime.date(2026, 10, 18)
+
+    # iVoox leaves blank the subscriptions updated 2 days ago
+    assert ivooxapi._parse_subscription_date('', today) == '2026-10-16'
+    assert ivooxapi._parse_subscription_date('ayer', today) == '2026-10-17'
+    assert ivooxapi._parse_subscription_date(None, today) is None
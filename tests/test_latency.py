@@ -0,0 +1,63 @@
+from __future__ import unicode_literals
+
+import requests
+
+from mopidy_podcast_ivoox import ivooxapi
+
+from . import latency
+from .fake_ivoox import FakeIVoox
+
+
+def test_fake_ivoox_login_flow():
+    with FakeIVoox() as server:
+        session = requests.session()
+        login_url = server.url + ivooxapi.format_url('LOGIN')
+        subscriptions_url = server.url + ivooxapi.format_url('SUBSCRIPTIONS')
+
+        assert session.get(subscriptions_url).url == login_url
+
+        home = session.post(login_url, data={'at-user': 'someone',
+                                             'at-pw': 'secret'})
+        assert 'main-navbar' in home.text
+        assert 'Program 100' in session.get(subscriptions_url).text
+
+
+def test_fake_ivoox_serves_every_listing():
+    with FakeIVoox(items=3) as server:
+        for name in ('EXPLORE_EPISODES', 'EXPLORE_PROGRAMS', 'EXPLORE_LISTS',
+                     'EXPLORE_CHANNELS', 'SEARCH_EPISODES', 'SEARCH_PROGRAMS',
+                     'SEARCH_CHANNELS', 'URL_PROGRAM'):
+            url = server.url + ivooxapi.format_url(name, 'f41', 2)
+            assert requests.get(url).status_code == 200, name
+
+
+def test_fake_ivoox_errors():
+    with FakeIVoox(error_rate=1) as server:
+        assert requests.get(server.url).status_code == 503
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(20, 0, -1))
+
+    assert latency.percentile(values, 50) == 10
+    assert latency.percentile(values, 95) == 19
+    assert latency.percentile(values, 99) == 20
+    assert latency.percentile(list(range(1, 101)), 99) == 99
+    assert latency.percentile([3], 50) == 3
+
+
+def test_latency_harness_counts_requests_per_step():
+    results = latency.run('anonymous', runs=2, latency=0, retries=0)
+    summary = latency.summary(results)
+
+    assert list(summary) == [
+        latency._label(index, step)
+        for index, step in enumerate(latency.SESSIONS['anonymous'])]
+    # The root directory is warmed up right after logging in
+    assert summary['1. login']['requests'] == 3
+    assert summary['2. browse podcast+ivoox:']['requests'] == 0
+    # Subgenres are not listed for genres: episodes and programs only
+    assert summary['3. browse podcast+ivoox:explore:f40']['requests'] == 2
+    # Going back to a browsed page is served from the cache
+    assert summary['5. browse podcast+ivoox:explore:f40']['requests'] == 0
+    assert all(step['errors'] == 0 for step in summary.values())
@@ -0,0 +1,39 @@
+from __future__ import unicode_literals
+
+from mopidy_podcast_ivoox.metrics import Metrics
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics(enabled=False)
+
+    with metrics.timer('fetch', 'SUBSCRIPTIONS'):
+        pass
+    metrics.started('SUBSCRIPTIONS')
+
+    assert metrics.snapshot() == {'stages': {}, 'in_flight': {}}
+
+
+def test_timings_by_stage_and_key():
+    ticks = iter([0, 0.25, 1, 1.75])
+    metrics = Metrics(enabled=True, clock=lambda: next(ticks))
+
+    with metrics.timer('fetch', 'SUBSCRIPTIONS'):
+        pass
+    with metrics.timer('fetch', 'SUBSCRIPTIONS'):
+        pass
+    metrics.record('parse', 'SUBSCRIPTIONS', 0.002)
+
+    stages = metrics.snapshot()['stages']
+    assert stages['fetch']['SUBSCRIPTIONS'] == {
+        'count': 2, 'total_ms': 1000, 'mean_ms': 500, 'max_ms': 750}
+    assert stages['parse']['SUBSCRIPTIONS']['count'] == 1
+
+
+def test_requests_in_flight():
+    metrics = Metrics(enabled=True)
+
+    metrics.started('LIST_HOME')
+    metrics.started('LIST_HOME')
+    metrics.finished('LIST_HOME')
+
+    assert metrics.snapshot()['in_flight'] == {'LIST_HOME': 1}
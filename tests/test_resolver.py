@@ -0,0 +1,64 @@
+from __future__ import unicode_literals
+
+import time
+
+import pytest
+
+from mopidy_podcast_ivoox.resolver import AudioResolver
+
+from .stub_server import StubServer
+
+
+@pytest.fixture
+def server():
+    stub = StubServer(pages={'media/1001.mp3': 'audio'}, redirects={
+        'listen_mn_1001_1.mp3': 'cdn/1001.mp3',
+        'cdn/1001.mp3': 'media/1001.mp3',
+    })
+    with stub:
+        yield stub
+
+
+@pytest.fixture
+def resolver():
+    resolver = AudioResolver()
+    yield resolver
+    resolver.close()
+
+
+def test_urls_are_resolved_once(server, resolver):
+    url = server.url + 'listen_mn_1001_1.mp3'
+
+    assert resolver.resolve(url) == server.url + 'media/1001.mp3'
+    assert resolver.resolve(url) == server.url + 'media/1001.mp3'
+    assert server.requests == [('HEAD', '/listen_mn_1001_1.mp3'),
+                               ('HEAD', '/cdn/1001.mp3'),
+                               ('HEAD', '/media/1001.mp3')]
+
+
+def test_unresolved_urls_are_left_to_the_player(server, resolver):
+    url = server.url + 'listen_mn_9999_1.mp3'
+
+    assert resolver.get(url) == url
+    assert resolver.resolve(url) == url
+    assert resolver.get(url) == url
+
+
+def test_resolved_urls_expire(server, resolver):
+    resolver._ttl = 0
+    url = server.url + 'listen_mn_1001_1.mp3'
+    resolver.resolve(url)
+
+    assert resolver.get(url) == url
+
+
+def test_prefetch_resolves_in_the_background(server, resolver):
+    url = server.url + 'listen_mn_1001_1.mp3'
+
+    resolver.prefetch([url])
+
+    for _ in range(100):
+        if resolver.get(url) != url:
+            break
+        time.sleep(0.01)
+    assert resolver.get(url) == server.url + 'media/1001.mp3'
@@ -0,0 +1,146 @@
+from __future__ import unicode_literals
+
+import hashlib
+
+import pytest
+
+from mopidy_podcast_ivoox import ivooxapi
+from mopidy_podcast_ivoox.scrapper import compile_matcher, compile_xpath
+
+from . import pages
+from .stub_server import StubServer
+
+
+@pytest.fixture
+def server():
+    stub = StubServer(pages={
+        'episodes.html': pages.episodes_page(30),
+        'programs.html': pages.programs_page(30),
+    })
+    with stub:
+        yield stub
+
+
+def test_compile_xpath_reuses_evaluators():
+    assert compile_xpath('.//li') is compile_xpath('.//li')
+
+
+@pytest.mark.parametrize('selector, tag, expression', [
+    ('.//tr', 'tr', 'self::tr'),
+    ('.//div[@itemtype="http://schema.org/RadioSeries"]', 'div',
+     'self::div[@itemtype="http://schema.org/RadioSeries"]'),
+    ('.//div[@class="pills-container"]//li', 'li',
+     'self::li[ancestor::div[@class="pills-container"]]'),
+])
+def test_compile_matcher(selector, tag, expression):
+    matcher = compile_matcher(selector)
+
+    assert matcher[0] == tag
+    assert matcher[1].path == expression
+
+
+@pytest.mark.parametrize('selector', ['.', './div/li', '//li'])
+def test_compile_matcher_rejects_other_axes(selector):
+    assert compile_matcher(selector) is None
+
+
+def test_scrappers_share_compiled_selectors():
+    first = ivooxapi.IVooxEpisodes()
+    second = ivooxapi.IVooxEpisodes()
+
+    assert first._select_items is second._select_items
+    assert first._fieldlist['name'].evaluate is \
+        second._fieldlist['name'].evaluate
+
+
+def test_scrap_episodes(server):
+    items = ivooxapi.IVooxEpisodes().scrap(server.url + 'episodes.html')
+
+    assert len(items) == 30
+    assert items[1]['name'] == 'Episode 1001'
+    assert items[1]['duration'] == 61
+    assert items[1]['guid'] == '1001'
+    assert items[1]['xml'] == 'podcast_fg_f1100.xml'
+    assert items[1]['mp3'] == 'listen_mn_1001_1.mp3'
+
+
+@pytest.mark.parametrize('scrapper, path', [
+    (ivooxapi.IVooxEpisodes, 'episodes.html'),
+    (ivooxapi.IVooxPrograms, 'programs.html'),
+])
+def test_scrap_stops_after_max_items(server, scrapper, path):
+    items = scrapper().scrap(server.url + path, max_items=5)
+
+    assert len(items) == 5
+
+
+def test_capped_scraps_hash_the_whole_page_if_asked(server):
+    body = server.pages['episodes.html'].encode('utf-8')
+    scrapper = ivooxapi.IVooxEpisodes(chunk_size=512)
+    response = scrapper.fetch(server.url + 'episodes.html')
+
+    list(scrapper.iterparse(response, max_items=5, digest=True))
+
+    assert scrapper.digest == hashlib.sha1(body).hexdigest()
+    assert scrapper.size == len(body)
+
+
+def test_capped_scraps_stop_reading_the_page(server):
+    scrapper = ivooxapi.IVooxEpisodes(chunk_size=4096)
+
+    scrapper.scrap(server.url + 'episodes.html', max_items=1)
+
+    assert scrapper.digest is None
+
+
+@pytest.mark.parametrize('scrapper, path', [
+    (ivooxapi.IVooxEpisodes, 'episodes.html'),
+    (ivooxapi.IVooxPrograms, 'programs.html'),
+])
+def test_streaming_matches_full_page_parsing(server, scrapper, path):
+    streamed = scrapper(chunk_size=512).scrap(server.url + path)
+    parsed = scrapper(stream=False).scrap(server.url + path)
+
+    assert streamed == parsed
+
+
+def test_iterscrap_is_lazy(server):
+    items = ivooxapi.IVooxEpisodes().iterscrap(server.url + 'episodes.html')
+
+    assert server.requests == []
+    assert next(items)['name'] == 'Episode 1000'
+    items.close()
+
+
+def test_items_are_compact_records(server):
+    items = ivooxapi.IVooxEpisodes().scrap(server.url + 'episodes.html')
+    item = items[1]
+
+    assert not hasattr(item, '__dict__')
+    assert isinstance(item, ivooxapi.IVooxEpisodes().record)
+    assert item.name == item['name'] == 'Episode 1001'
+    # Plain strings, not keeping the parsed page alive
+    assert not hasattr(item.name, 'getparent')
+    # Derived fields are only parsed when read
+    assert item.mp3 == 'listen_mn_1001_1.mp3'
+    assert 'guid' not in item.to_json()
+    assert item.to_json()['url'] == item.url
+
+
+def test_records_from_json():
+    record = ivooxapi.IVooxPrograms().record
+    item = record.from_dict({'name': 'Program 1',
+                             'url': 'podcast-program_sq_f11_1.html'})
+
+    assert item.xml == 'podcast_fg_f11.xml'
+    assert item.audios is None
+    assert record.from_dict(item.to_json()) == item
+    with pytest.raises(KeyError):
+        item['unknown']
+
+
+def test_unparsable_derived_fields_take_their_default():
+    record = ivooxapi.IVooxSimpleItems().record
+    item = record.from_dict({'name': 'Channel 1', 'url': 'channel.html'})
+
+    assert item.code is None
@@ -0,0 +1,56 @@
+from __future__ import unicode_literals
+
+import mock
+
+from mopidy_podcast_ivoox import ivooxapi
+from mopidy_podcast_ivoox.store import ScrapStore
+
+
+def test_put_and_get_items():
+    store = ScrapStore()
+    store.put('key', [{'name': 'Episode', 'duration': 61}],
+              etag='"abc"', last_modified='Sat, 17 Oct 2026 10:00:00 GMT')
+
+    entry = store.get('key')
+
+    assert entry.items == [{'name': 'Episode', 'duration': 61}]
+    assert entry.etag == '"abc"'
+    assert entry.last_modified == 'Sat, 17 Oct 2026 10:00:00 GMT'
+    assert entry.fetched > 0
+    assert store.get('other') is None
+
+
+def test_entries_persist_across_instances(tmpdir):
+    path = str(tmpdir.join('scraps.db'))
+    store = ScrapStore(path)
+    store.put('key', ['item'])
+    store.close()
+
+    assert ScrapStore(path).get('key').items == ['item']
+
+
+def test_records_are_stored_as_their_fields():
+    store = ScrapStore()
+    record = ivooxapi.IVooxCategories().record
+    items = [record('Category 1', 'audios_sa_f41_1.html')]
+
+    store.put('key', items)
+
+    assert store.get('key').items == [
+        {'name': 'Category 1', 'url': 'audios_sa_f41_1.html'}]
+    assert store.get('key', record=record).items == items
+    assert store.get('key', record=record).items[0].code == 'f41'
+
+
+def test_least_recently_fetched_entries_are_pruned():
+    store = ScrapStore(max_items=2)
+    with mock.patch('time.time', side_effect=[1, 2, 3, 4]):
+        store.put('first', ['item'])
+        store.put('second', ['item'])
+        store.touch('first')
+        store.put('third', ['item'])
+
+    assert len(store) == 2
+    assert store.get('first') is not None
+    assert store.get('second') is None
+    assert store.get('third') is not None
@@ -0,0 +1,100 @@
+from __future__ import unicode_literals
+
+import pytest
+
+from mopidy_podcast_ivoox.client import IVooxClient
+from mopidy_podcast_ivoox.subscriptions import SubscriptionSync
+
+from . import pages
+from .stub_server import StubServer
+
+
+SUBSCRIPTIONS = 'gestionar-suscripciones_je_1.html?order=date'
+
+
+@pytest.fixture
+def server():
+    stub = StubServer(pages={
+        'ajx-login_zl.html': pages.PAGE.format(''),
+        '': pages.home_page(user='someone'),
+        SUBSCRIPTIONS: pages.subscriptions_page(3),
+        'podcast_sq_f1100_1.html': pages.episodes_page(2, 100),
+        'podcast_sq_f1101_1.html': pages.episodes_page(2, 101),
+        'podcast_sq_f1102_1.html': pages.episodes_page(2, 102),
+    }, post_redirects={'ajx-login_zl.html': ''})
+    with stub:
+        yield stub
+
+
+@pytest.fixture
+def client(server):
+    client = IVooxClient(baseurl=server.url)
+    client.login('someone', 'secret')
+    del server.requests[:]
+    yield client
+    client.close()
+
+
+def _episode_requests(server):
+    return sorted(path for _, path in server.requests
+                  if path.startswith('/podcast_sq_'))
+
+
+def test_programs_are_polled_once_per_interval(server, client):
+    sync = SubscriptionSync(client, interval=60)
+
+    programs = sync.programs()
+    sync.programs()
+
+    assert [program.code for program in programs] == \
+        ['f1100', 'f1101', 'f1102']
+    assert server.requests == [('GET', '/' + SUBSCRIPTIONS)]
+
+
+def test_poll_refetches_only_changed_programs_already_loaded(server, client):
+    sync = SubscriptionSync(client, interval=0)
+    sync.programs()
+    sync.episodes('f1100')
+    sync.episodes('f1101')
+    del server.requests[:]
+
+    # Programs 101 and 102 get new episodes, but 102 was never browsed
+    page = server.pages[SUBSCRIPTIONS]
+    server.pages[SUBSCRIPTIONS] = page \
+        .replace('circle-link">2<', 'circle-link">3<') \
+        .replace('circle-link">1<', 'circle-link">2<')
+    client.invalidate('get_subscriptions')
+
+    assert sync.poll() == ['f1101', 'f1102']
+    assert _episode_requests(server) == ['/podcast_sq_f1101_1.html']
+
+    # Unchanged programs are served without any request
+    del server.requests[:]
+    sync.episodes('f1100')
+    sync.episodes('f1101')
+    assert server.requests == []
+
+
+def test_state_is_kept_in_the_store_for_the_user(server, client):
+    SubscriptionSync(client, interval=0).programs()
+    del server.requests[:]
+
+    # A new sync, as after a restart, finds no changes
+    client.invalidate('get_subscriptions')
+    assert SubscriptionSync(client, interval=0).poll() == []
+
+
+def test_refresh_reloads_the_episodes_of_a_program(server, client):
+    sync = SubscriptionSync(client, interval=60)
+    sync.programs()
+    sync.episodes('f1100')
+    del server.requests[:]
+
+    sync.refresh('f1100')
+    sync.programs()
+    sync.episodes('f1100')
+
+    assert server.requests == [
+        ('GET', '/' + SUBSCRIPTIONS),
+        ('GET', '/podcast_sq_f1100_1.html'),
+    ]
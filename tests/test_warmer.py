@@ -0,0 +1,93 @@
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from mopidy.models import Ref
+
+from mopidy_podcast_ivoox.warmer import CacheWarmer
+
+
+class FakeLibrary(object):
+
+    root_directory = Ref.directory(uri='root:', name='Root')
+
+    tree = {
+        'root:': [Ref.directory(uri='explore', name='Explore'),
+                  Ref.album(uri='program', name='Program'),
+                  Ref.directory(uri='root:page=2', name='Next'),
+                  Ref.directory(uri='more', name='More')],
+        'explore': [Ref.directory(uri='explore:a', name='A'),
+                    Ref.directory(uri='explore:b', name='B')],
+        'explore:a': [Ref.directory(uri='explore:a:1', name='A1')],
+    }
+
+    def __init__(self):
+        self.login_done = threading.Event()
+        self.browsed = []
+
+    def browse(self, uri):
+        self.browsed.append(uri)
+        return self.tree.get(uri, [])
+
+
+def test_walk_browses_directories_down_to_depth():
+    library = FakeLibrary()
+    warmer = CacheWarmer(library, depth=2, delay=0, skip_names=['More'])
+
+    warmer.walk()
+
+    assert library.browsed == ['root:', 'explore', 'explore:a', 'explore:b']
+    assert warmer.state == CacheWarmer.WARM
+
+
+def test_walk_waits_delay_between_pages():
+    library = FakeLibrary()
+    warmer = CacheWarmer(library, depth=1, delay=0.1, skip_names=['More'])
+
+    start = time.time()
+    warmer.walk()
+
+    assert library.browsed == ['root:', 'explore']
+    assert time.time() - start >= 0.2
+
+
+def test_warmer_starts_after_login_and_runs_prefetches():
+    library = FakeLibrary()
+    warmer = CacheWarmer(library, depth=0, delay=0)
+    prefetched = threading.Event()
+
+    warmer.start()
+    warmer.prefetch(prefetched.set)
+    time.sleep(0.1)
+    assert warmer.state == CacheWarmer.COLD
+
+    library.login_done.set()
+    assert prefetched.wait(1)
+    while warmer.state != CacheWarmer.WARM:
+        time.sleep(0.01)
+    warmer.stop()
+
+    assert library.browsed == ['root:']
+
+
+def test_prefetches_are_spaced_out_by_delay():
+    library = FakeLibrary()
+    warmer = CacheWarmer(library, depth=0, delay=0.1)
+    times = []
+    done = threading.Event()
+
+    def prefetch():
+        times.append(time.time())
+        if len(times) == 3:
+            done.set()
+
+    for _ in range(3):
+        warmer.prefetch(prefetch)
+    library.login_done.set()
+    warmer.start()
+    assert done.wait(2)
+    warmer.stop()
+
+    assert all(later - earlier >= 0.09
+               for earlier, later in zip(times, times[1:]))